@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Optional, Tuple
+from time import time
+import asyncio
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCK_POLL_S = 0.05
+
+
+class TokenCache:
+    """
+    Access tokens shared through a file by the processes of a host, e.g. prefork workers.
+    The file is locked while a token is checked and renewed, so that a single process requests a new one
+    and the rest reuse it. Locking requires fcntl, without it every process renews the token on its own
+    """
+
+    def __init__(self, path: str, lock_timeout: Optional[float] = None) -> None:
+        """
+        :param path: file the tokens are stored in. Is created readable by the current user only
+        :param lock_timeout: seconds to wait for the lock, after which the token is requested without it
+        """
+        self.path = path
+        self.lock_timeout = lock_timeout
+
+    async def get(self, account: str, request: Callable[[], Awaitable[Tuple[str, float]]], min_validity: float) -> Tuple[str, float]:
+        """
+        :param account: identity the token belongs to
+        :param request: requests a new token, returns it together with its expiry timestamp
+        :param min_validity: seconds a cached token should still be valid for to be reused
+        :return: access token and its expiry timestamp
+        """
+        fd = await self.__lock()
+        try:
+            tokens = self.__read()
+            cached = tokens.get(account)
+            if cached is not None and cached["expires_at"] - time() > min_validity:
+                return cached["access_token"], cached["expires_at"]
+
+            token, expires_at = await request()
+            tokens[account] = {"access_token": token, "expires_at": expires_at}
+            self.__write(tokens)
+            return token, expires_at
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    async def __lock(self) -> Optional[int]:
+        if fcntl is None:
+            return None
+
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        deadline = None if self.lock_timeout is None else time() + self.lock_timeout
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    if deadline is not None and time() > deadline:
+                        os.close(fd)
+                        return None
+                    # Not waiting in a thread, so that a cancelled wait can not take the lock afterwards
+                    await asyncio.sleep(LOCK_POLL_S)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def __read(self) -> dict:
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __write(self, tokens: dict) -> None:
+        temporary = f"{self.path}.{os.getpid()}"
+        with open(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as file:
+            json.dump(tokens, file)
+        os.replace(temporary, self.path)
@@ -0,0 +1,91 @@
+"""
+Local stand-in of the Datastore REST API the benchmarks run against: memory.MemoryDatastore served over HTTP
+together with a token endpoint, with an injected latency
+"""
+from __future__ import annotations
+
+from random import uniform
+from typing import Dict, Optional
+import asyncio
+import json
+
+from aiohttp import web
+
+from datastore.errors import RequestFailed
+from datastore.memory import MemoryDatastore
+
+
+class FakeDatastore:
+    def __init__(self, latency: float = 0, jitter: float = 0, latencies: Optional[Dict[str, float]] = None,
+                 page_size: int = 300, lookup_page: Optional[int] = None) -> None:
+        """
+        :param latency: seconds every API Call is delayed by
+        :param jitter: max seconds added to the latency at random
+        :param latencies: latency by the method of the API Call, overrides the common one
+        :param page_size: max number of entity results in a query response
+        :param lookup_page: max number of entities found by a lookup, the rest is deferred. Not limited by default
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.latencies = {} if latencies is None else latencies
+        self.datastore = MemoryDatastore(page_size=page_size, lookup_page=lookup_page)
+        self.calls: Dict[str, int] = {}
+        self.__runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        :param port: 0 to pick a free one
+        :return: endpoint to pass to Client
+        """
+        app = web.Application(client_max_size=16 * 2 ** 20)
+        app.router.add_post("/token", self.__token)
+        app.router.add_post("/v1/projects/{project}:{method}", self.__rpc)
+        self.__runner = web.AppRunner(app, access_log=None)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, host, port)
+        await site.start()
+        host, port = self.__runner.addresses[0][:2]
+        self.endpoint = f"http://{host}:{port}"
+        return self.endpoint
+
+    async def stop(self) -> None:
+        await self.__runner.cleanup()
+        self.__runner = None
+
+    def credentials(self, path: str, project_id: str = "benchmark") -> str:
+        """
+        Writes service account credentials whose token URI points to the server
+        :return: path
+        """
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_key = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                        serialization.NoEncryption()).decode()
+        with open(path, "w") as file:
+            json.dump({"project_id": project_id, "token_uri": f"{self.endpoint}/token", "private_key": private_key,
+                       "client_email": "benchmark@localhost"}, file)
+        return path
+
+    def clear(self) -> None:
+        self.calls.clear()
+        self.datastore.clear()
+
+    async def __token(self, _: web.Request) -> web.Response:
+        return web.json_response({"access_token": "benchmark", "expires_in": 3600})
+
+    async def __rpc(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        body = json.loads(await request.read())
+
+        latency = self.latencies.get(method, self.latency) + (uniform(0, self.jitter) if self.jitter else 0)
+        if latency:
+            await asyncio.sleep(latency)
+
+        try:
+            response = self.datastore.call(method, body)
+        except RequestFailed as error:
+            return web.json_response({"error": {"code": error.status, "message": str(error)}}, status=error.status)
+        return web.json_response(response, dumps=lambda value: json.dumps(value, separators=(",", ":")))
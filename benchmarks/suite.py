@@ -0,0 +1,265 @@
+"""
+Throughput and latency percentiles of the client against the local stand-in of Datastore (benchmarks/server.py):
+bulk save, bulk lookup, paginated query, transactions contending for a few entities,
+and of the ODM encoding and decoding of flat, deeply embedded and large array entities.
+Results are written as JSON, so that they can be compared between releases
+
+Run from the directory containing the package: python -m datastore.benchmarks.suite --output results.json
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List
+import asyncio
+import json
+import os
+import platform
+
+from datastore.client import Client
+from datastore.errors import TransactionFailed
+from datastore.odm import Kind, Embedded, IntegerField, StringField, BooleanField, DoubleField, ArrayField
+from datastore.benchmarks.server import FakeDatastore
+
+
+class Flat(Kind):
+    title = StringField(index=True)
+    language = StringField()
+    released = BooleanField()
+    rating = DoubleField()
+    n_borrowed = IntegerField()
+    isbn = StringField()
+    pages = IntegerField()
+    price = DoubleField()
+
+
+class Level3(Embedded):
+    value = IntegerField()
+    label = StringField()
+
+
+class Level2(Embedded):
+    value = IntegerField()
+    nested = Level3()
+
+
+class Level1(Embedded):
+    value = IntegerField()
+    nested = Level2()
+
+
+class Deep(Kind):
+    title = StringField()
+    nested = Level1()
+    siblings = ArrayField(Level1())
+
+
+class Wide(Kind):
+    title = StringField()
+    values = ArrayField(IntegerField())
+
+
+class Counter(Kind):
+    value = IntegerField()
+
+
+def flat(i: int) -> Flat:
+    return Flat(id=i + 1, title=f"title {i}", language="en", released=True, rating=4.5, n_borrowed=i, isbn="978-3-16",
+                pages=320, price=9.99)
+
+
+def deep(i: int) -> Deep:
+    def level(j: int) -> Level1:
+        return Level1(value=j, nested=Level2(value=j, nested=Level3(value=j, label=f"label {j}")))
+    return Deep(id=i + 1, title=f"title {i}", nested=level(i), siblings=[level(j) for j in range(5)])
+
+
+def wide(i: int) -> Wide:
+    return Wide(id=i + 1, title=f"title {i}", values=list(range(1000)))
+
+
+SHAPES: Dict[str, Callable[[int], Kind]] = {"flat": flat, "deep": deep, "wide": wide}
+
+
+def summary(operations: int, seconds: float, latencies: List[float], **extra: float) -> dict:
+    """
+    :param operations: number of the operations done in total, e.g. entities saved
+    :param latencies: seconds of every measured request or batch
+    """
+    latencies = sorted(latencies)
+    return {"operations": operations,
+            "seconds": seconds,
+            "throughput": operations / seconds if seconds else None,
+            "p50_ms": median(latencies) * 1000 if latencies else None,
+            "p99_ms": latencies[min(int(len(latencies) * .99), len(latencies) - 1)] * 1000 if latencies else None,
+            **extra}
+
+
+async def timed(latencies: List[float], awaitable: Awaitable) -> None:
+    started = perf_counter()
+    await awaitable
+    latencies.append(perf_counter() - started)
+
+
+async def bulk_save(client: Client, entities: int, batch: int) -> dict:
+    latencies = []
+
+    async def save(start: int) -> None:
+        async with client.Batch() as commit:
+            for i in range(start, min(start + batch, entities)):
+                commit.save(flat(i))
+
+    started = perf_counter()
+    await asyncio.gather(*(timed(latencies, save(start)) for start in range(0, entities, batch)))
+    return summary(entities, perf_counter() - started, latencies, batch=batch)
+
+
+async def bulk_lookup(client: Client, entities: int, batch: int) -> dict:
+    latencies = []
+    keys = [flat(i).key for i in range(entities)]
+    started = perf_counter()
+    await asyncio.gather(*(timed(latencies, client.lookup_multiple(*keys[start:start + batch]))
+                           for start in range(0, entities, batch)))
+    return summary(entities, perf_counter() - started, latencies, batch=batch)
+
+
+async def paginated_query(client: Client, entities: int) -> dict:
+    latencies = []
+    n = 0
+    started = last = perf_counter()
+    async for page in client.query_pages(Flat._request(None, Flat._query())):
+        now = perf_counter()
+        latencies.append(now - last)
+        n += sum(1 for _ in Kind._from_entities(page, client))
+        last = perf_counter()
+    if n != entities:
+        raise RuntimeError(f"Query returned {n} entities out of {entities}")
+    return summary(n, perf_counter() - started, latencies, pages=len(latencies))
+
+
+async def transaction_contention(client: Client, workers: int, transactions: int, hot_keys: int) -> dict:
+    async with client.Batch() as commit:
+        for i in range(hot_keys):
+            commit.save(Counter(client, id=i + 1, value=0))
+
+    latencies = []
+    aborted = 0
+
+    async def increment(i: int) -> None:
+        nonlocal aborted
+        key = Counter(client, id=i % hot_keys + 1).key
+        for attempt in range(1, 100):
+            try:
+                async with client.Transaction() as transaction:
+                    counter, = await transaction.lookup(key)
+                    counter.value += 1
+                    transaction.save(counter)
+                return
+            except TransactionFailed:
+                aborted += 1
+                await asyncio.sleep(client.retry["transaction"].delay(attempt))
+        raise RuntimeError("Transaction was not committed in 100 attempts")
+
+    semaphore = asyncio.Semaphore(workers)
+
+    async def worker(i: int) -> None:
+        async with semaphore:
+            await timed(latencies, increment(i))
+
+    started = perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(transactions)))
+    seconds = perf_counter() - started
+
+    counters = await client.lookup_multiple(*(Counter(client, id=i + 1).key for i in range(hot_keys)))
+    if sum(counter.value for counter in counters) != transactions:
+        raise RuntimeError("Lost updates detected")
+    return summary(transactions, seconds, latencies, workers=workers, hot_keys=hot_keys, aborted=aborted)
+
+
+def odm(entities: int) -> Dict[str, dict]:
+    results = {}
+    for shape, create in SHAPES.items():
+        instances = [create(i) for i in range(min(entities, 1000))]
+        n = len(instances)
+
+        latencies = []
+        started = perf_counter()
+        encoded = []
+        for instance in instances:
+            start = perf_counter()
+            encoded.append({"entity": instance._to_entity()})
+            latencies.append(perf_counter() - start)
+        results[f"encode_{shape}"] = summary(n, perf_counter() - started, latencies)
+
+        latencies = []
+        started = perf_counter()
+        for entity in encoded:
+            start = perf_counter()
+            Kind._from_entity(entity)
+            latencies.append(perf_counter() - start)
+        results[f"decode_{shape}"] = summary(n, perf_counter() - started, latencies)
+
+        started = perf_counter()
+        for _ in Kind._from_entities(encoded):
+            pass
+        results[f"decode_bulk_{shape}"] = summary(n, perf_counter() - started, [])
+    return results
+
+
+async def run(args: SimpleNamespace) -> dict:
+    server = FakeDatastore(latency=args.latency, jitter=args.jitter)
+    endpoint = await server.start()
+    try:
+        with TemporaryDirectory() as directory:
+            client = Client(server.credentials(os.path.join(directory, "credentials.json")), endpoint=endpoint)
+            await client.connect()
+        try:
+            for kind in (Flat, Deep, Wide, Counter):
+                kind.ds = client
+
+            results = {"odm": odm(args.entities)}
+            results["bulk_save"] = await bulk_save(client, args.entities, args.batch)
+            results["bulk_lookup"] = await bulk_lookup(client, args.entities, args.batch)
+            results["paginated_query"] = await paginated_query(client, args.entities)
+            results["transaction_contention"] = await transaction_contention(client, args.workers, args.transactions,
+                                                                             args.hot_keys)
+            results["calls"] = dict(server.calls)
+            return results
+        finally:
+            await client.disconnect()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", default="benchmark.json", help="file the results are written to")
+    parser.add_argument("--entities", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=500, help="entities per bulk save and lookup")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds every API Call is delayed by")
+    parser.add_argument("--jitter", type=float, default=0.002, help="max seconds added to the latency at random")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent transactions")
+    parser.add_argument("--transactions", type=int, default=500)
+    parser.add_argument("--hot-keys", type=int, default=4, help="entities the transactions contend for")
+    args = parser.parse_args()
+
+    results = {"created": datetime.now(timezone.utc).isoformat(),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "parameters": vars(args),
+               "results": asyncio.run(run(args))}
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    measured = {name: result for name, result in results["results"].items() if name not in ("odm", "calls")}
+    for operation, values in {**results["results"]["odm"], **measured}.items():
+        latencies = "" if values["p50_ms"] is None else f"  p50 {values['p50_ms']:>9.3f} ms  p99 {values['p99_ms']:>9.3f} ms"
+        print(f"{operation:>24} {values['throughput']:>12,.0f}/s{latencies}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple, Union, TYPE_CHECKING
+import asyncio
+
+from .datatypes import Key
+from .errors import RequestFailed
+from .retry import RETRY_STATUSES
+
+if TYPE_CHECKING:
+    from .odm.kind import Kind
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer of non-transactional mutations. Mutations of the same key are coalesced: the last one wins,
+    so that an entity saved many times in a row is committed once. Mutations are committed once the buffer holds
+    a full batch, once the oldest of them waited for the interval, or once WriteBuffer.flush is called.
+    Mutations of a flush that failed transiently are buffered again, unless they were written anew meanwhile.
+    Writers wait while the buffer is full
+    """
+
+    def __init__(self, execute: Callable[..., Awaitable[Set[Union[Kind, Key]]]], size: int = 500, interval: float = 1,
+                 max_pending: int = 5000) -> None:
+        """
+        :param execute: commits mutations, see Client._execute
+        :param size: number of buffered mutations that triggers a flush
+        :param interval: max seconds a mutation stays buffered
+        :param max_pending: number of buffered and flushing mutations writers wait at
+        """
+        self.size = size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.__execute = execute
+        # Method and operand by key, in the order of their last write
+        self.__pending: Dict[Key, Tuple[str, Union[Kind, Key]]] = {}
+        self.__flushing = 0
+        # Flushes are committed one after another, so that a newer mutation of a key is never overtaken by an older one
+        self.__lock = asyncio.Lock()
+        self.__drained = asyncio.Condition()
+        self.__timer: Optional[asyncio.TimerHandle] = None
+        # Whether a flush is waiting for its turn, it takes all the mutations buffered until then
+        self.__scheduled = False
+        self.__tasks: Set[asyncio.Task] = set()
+        self.__error: Optional[BaseException] = None
+
+    def __len__(self) -> int:
+        return len(self.__pending)
+
+    async def save(self, entity: Kind) -> None:
+        await self.__write(entity.key, "save", entity)
+
+    async def update(self, entity: Kind) -> None:
+        """
+        :raise ValueError: if the deletion of the entity is buffered
+        """
+        await self.__write(entity.key, "update", entity)
+
+    async def delete(self, entity: Union[Kind, Key]) -> None:
+        await self.__write(entity if isinstance(entity, Key) else entity.key, "delete", entity)
+
+    async def __write(self, key: Key, method: str, op: Union[Kind, Key]) -> None:
+        if key not in self.__pending:
+            async with self.__drained:
+                await self.__drained.wait_for(lambda: len(self.__pending) + self.__flushing < self.max_pending)
+
+        previous = self.__pending.get(key)
+        if method == "update" and previous is not None:
+            # An update of a deleted entity always fails, and would fail the whole flush with it
+            if previous[0] == "delete":
+                raise ValueError(f"{key} is deleted, it can only be saved anew")
+            # An update of an entity whose upsert is still buffered is the upsert of its newer state
+            if previous[0] == "save":
+                method = "save"
+        self.__pending.pop(key, None)
+        self.__pending[key] = (method, op)
+
+        if len(self.__pending) >= self.size:
+            self.__spawn()
+        elif self.__timer is None:
+            self.__timer = asyncio.get_running_loop().call_later(self.interval, self.__spawn)
+
+    def __requeue(self, failed: Dict[Key, Tuple[str, Union[Kind, Key]]]) -> None:
+        """
+        Buffers the mutations of a failed flush again, before the ones written since. Saves and deletes are idempotent,
+        and entities whose commit succeeded are not dirty anymore, so committing the whole flush again is safe
+        """
+        pending = {}
+        for key, (method, op) in failed.items():
+            newer = self.__pending.pop(key, None)
+            if newer is None:
+                pending[key] = (method, op)
+            # The newer write wins, an update of an entity whose upsert failed is the upsert of its newer state
+            elif newer[0] == "update" and method == "save":
+                pending[key] = ("save", newer[1])
+            else:
+                pending[key] = newer
+        pending.update(self.__pending)
+        self.__pending = pending
+        # Retried after the interval rather than right away, while the failure likely persists
+        if self.__timer is None:
+            self.__timer = asyncio.get_running_loop().call_later(self.interval, self.__spawn)
+
+    def __spawn(self) -> None:
+        if self.__scheduled:
+            return
+        self.__scheduled = True
+        task = asyncio.create_task(self.__flush())
+        self.__tasks.add(task)
+        task.add_done_callback(self.__done)
+
+    def __done(self, task: asyncio.Task) -> None:
+        self.__tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.__error = task.exception()
+
+    async def flush(self) -> None:
+        """
+        Commits all the buffered mutations
+        :raise RequestFailed: if a commit of this or of a previous timed flush failed. Mutations that failed transiently
+        stay buffered
+        """
+        await self.__flush()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        error, self.__error = self.__error, None
+        if error is not None:
+            raise error
+
+    async def __flush(self) -> None:
+        async with self.__lock:
+            self.__scheduled = False
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            pending, self.__pending = self.__pending, {}
+            if not pending:
+                return
+
+            ops = {"save": [], "update": [], "delete": []}
+            for method, op in pending.values():
+                ops[method].append(op)
+            self.__flushing = len(pending)
+            try:
+                await self.__execute(**ops)
+            except RequestFailed as error:
+                if error.status in RETRY_STATUSES:
+                    self.__requeue(pending)
+                raise
+            finally:
+                self.__flushing = 0
+                async with self.__drained:
+                    self.__drained.notify_all()
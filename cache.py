@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from sys import getsizeof
+from time import monotonic
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+# Cached result of a lookup that did not find an entity
+MISSING = object()
+
+
+def _sizeof(value: Any) -> int:
+    size = getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(getsizeof(key) + _sizeof(item) for key, item in value.items())
+    elif isinstance(value, list):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+
+class EntityCache:
+    """
+    Process-local cache of entity results ("found" items of the lookup API Call) keyed by the key path.
+    Least recently used entries are evicted once either of the bounds is exceeded
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 2 ** 20, ttl: Optional[float] = 60,
+                 missing_ttl: Optional[float] = None) -> None:
+        """
+        :param max_entries: max number of cached entities
+        :param max_bytes: max approximate memory taken by the cached entities
+        :param ttl: seconds an entity stays cached, None to keep it until evicted
+        :param missing_ttl: seconds an absence of an entity stays cached. Defaults to ttl
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.missing_ttl = ttl if missing_ttl is None else missing_ttl
+        self.bytes = 0
+        self.__entries: OrderedDict[Hashable, Tuple[Optional[float], int, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, path: Hashable, default: Any = None) -> Any:
+        """
+        :return: cached entity result, MISSING if the entity is known to not exist, default if nothing is cached
+        """
+        entry = self.__entries.get(path)
+        if entry is None:
+            return default
+
+        expires, _, entity = entry
+        if expires is not None and expires <= monotonic():
+            self.discard(path)
+            return default
+
+        self.__entries.move_to_end(path)
+        return entity
+
+    def put(self, path: Hashable, entity: Any) -> None:
+        """
+        :param entity: entity result or MISSING
+        """
+        self.discard(path)
+
+        ttl = self.missing_ttl if entity is MISSING else self.ttl
+        size = getsizeof(path) if entity is MISSING else _sizeof(entity)
+        if size > self.max_bytes:
+            return
+
+        self.__entries[path] = (None if ttl is None else monotonic() + ttl, size, entity)
+        self.bytes += size
+        while len(self.__entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, size, _) = self.__entries.popitem(last=False)
+            self.bytes -= size
+
+    def discard(self, path: Hashable) -> None:
+        entry = self.__entries.pop(path, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.bytes = 0
+
+
+class QueryCache:
+    """
+    Process-local cache of query results (entity result pages of the runQuery API Call) keyed by the normalized query.
+    Results are invalidated by the mutations of their kind made by the client. Eventually consistent queries
+    may still be served invalidated results for QueryCache.max_staleness seconds.
+    Least recently used entries are evicted once either of the bounds is exceeded
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 2 ** 20, ttl: Optional[float] = 60,
+                 max_staleness: float = 0, max_results: Optional[int] = 1000) -> None:
+        """
+        :param max_entries: max number of cached queries
+        :param max_bytes: max approximate memory taken by the cached results
+        :param ttl: seconds results stay cached, None to keep them until invalidated or evicted
+        :param max_staleness: seconds invalidated results are still served to eventually consistent queries
+        :param max_results: max number of entity results of a query to be cached, None to not limit
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self.max_results = max_results
+        self.bytes = 0
+        # Query: expiry, size, kind, invalidation time, pages
+        self.__entries: OrderedDict[Hashable, Tuple[Optional[float], int, Hashable, Optional[float], Any]] = OrderedDict()
+        self.__queries: Dict[Hashable, Set[Hashable]] = {}
+        # Incremented with every invalidation, so that results received before it are not cached after it
+        self.__generations: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def generation(self, kind: Hashable) -> int:
+        """
+        :param kind: namespace and name of the kind
+        :return: token to pass to QueryCache.put of the results of a query sent now
+        """
+        return self.__generations.get(kind, 0)
+
+    def get(self, query: Hashable, eventual: bool = False, default: Any = None) -> Any:
+        """
+        :param query: normalized query
+        :param eventual: whether the query allows results invalidated less than QueryCache.max_staleness seconds ago
+        :return: cached pages, default if nothing is cached
+        """
+        entry = self.__entries.get(query)
+        if entry is None:
+            return default
+
+        expires, _, _, invalidated, pages = entry
+        now = monotonic()
+        if expires is not None and expires <= now:
+            self.discard(query)
+            return default
+        if invalidated is not None:
+            if now - invalidated > self.max_staleness:
+                self.discard(query)
+                return default
+            if not eventual:
+                return default
+
+        self.__entries.move_to_end(query)
+        return pages
+
+    def put(self, query: Hashable, kind: Hashable, generation: int, pages: List[List[dict]]) -> None:
+        """
+        :param query: normalized query
+        :param kind: namespace and name of the kind
+        :param generation: QueryCache.generation of the kind taken before the query was sent
+        """
+        if generation != self.generation(kind):
+            return
+        if self.max_results is not None and sum(map(len, pages)) > self.max_results:
+            return
+
+        self.discard(query)
+        size = _sizeof(pages)
+        if size > self.max_bytes:
+            return
+
+        self.__entries[query] = (None if self.ttl is None else monotonic() + self.ttl, size, kind, None, pages)
+        self.__queries.setdefault(kind, set()).add(query)
+        self.bytes += size
+        while len(self.__entries) > self.max_entries or self.bytes > self.max_bytes:
+            self.discard(next(iter(self.__entries)))
+
+    def invalidate(self, kind: Hashable) -> None:
+        """
+        Called for every kind mutated by the client
+        :param kind: namespace and name of the kind
+        """
+        self.__generations[kind] = self.generation(kind) + 1
+        queries = self.__queries.get(kind)
+        if not queries:
+            return
+
+        if not self.max_staleness:
+            for query in tuple(queries):
+                self.discard(query)
+            return
+
+        now = monotonic()
+        for query in queries:
+            expires, size, kind, invalidated, pages = self.__entries[query]
+            if invalidated is None:
+                self.__entries[query] = (expires, size, kind, now, pages)
+
+    def discard(self, query: Hashable) -> None:
+        entry = self.__entries.pop(query, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            queries = self.__queries[entry[2]]
+            queries.discard(query)
+            if not queries:
+                del self.__queries[entry[2]]
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.__queries.clear()
+        self.bytes = 0
@@ -1,304 +1,921 @@
 from __future__ import annotations
 
+from collections import Counter
 import functools
-from typing import Optional, Union, Tuple, Iterable, Set, Dict, Type
-from urllib.parse import urlencode
-from time import time
-from os import getenv
+from typing import Any, Awaitable, Callable, Optional, Union, Tuple, Iterable, Iterator, AsyncIterator, Dict, List, Set, Type
+from time import monotonic, perf_counter
 import asyncio
-import json
-
-from aiohttp import ClientSession, TCPConnector
-import jwt
-
+import heapq
+import inspect
+
+from .auth import TokenCache
+from .buffer import WriteBuffer
+from .cache import EntityCache, QueryCache, MISSING
+from .codec import Codec, default_codec
+from .pool import IdPool
+from .retry import RetryPolicy, default_retry
+from .metrics import Metrics
+from .throttle import WriteThrottle
+from .ordering import KEY, key_order, value_orders
+from .transport import Transport, HttpTransport, CONNECT_TIMEOUT_S, ENDPOINT
 from .datatypes import Key
 from .odm.kind import Kind
-from .errors import TransactionFailed
+from .errors import TransactionFailed, RequestFailed
+
+COMMIT_MAX_MUTATIONS = 500
+# Datastore rejects requests over 10 MiB, keep some room for the request envelope
+COMMIT_MAX_BYTES = 10 * 2 ** 20 - 2 ** 16
+COMMIT_CONCURRENCY = 8
+
+QUERY_PREFETCH = 1
+QUERY_CONCURRENCY = 8
+
+LOOKUP_MAX_KEYS = 1000
+LOOKUP_CONCURRENCY = 8
+LOOKUP_BACKOFF_S = 0.05
+LOOKUP_MAX_BACKOFF_S = 2
+
+AGGREGATION_MAX = 5
+
+MERGE_RETRIES = 5
+
+BUFFER_INTERVAL_S = 1
+BUFFER_MAX_PENDING = 5000
+
+ALLOCATE_MAX_KEYS = 500
+ID_POOL_SIZE = 1000
+ID_POOL_LOW_WATER = 250
+
+
+def _mutation_key(mutation: dict) -> dict:
+    return mutation["delete"] if "delete" in mutation else next(value for method, value in mutation.items() if method != "baseVersion")["key"]
+
+
+class _Descending:
+    """
+    Reverses the order of a value
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
 
-REQUEST_URL = "https://datastore.googleapis.com/v1/projects/{project_id}:{method}"
+    def __eq__(self, other: _Descending) -> bool:
+        return self.value == other.value
 
-TOKEN_LIFETIME_S = 3600
-TOKEN_RENEW_BEFOREHAND_S = 100
+    def __lt__(self, other: _Descending) -> bool:
+        return other.value < self.value
+
+
+def _sort_key(result: dict, order: Tuple[Tuple[str, bool], ...]) -> tuple:
+    """
+    Position of an entity result in the order of a query, ties are ordered by key
+    """
+    entity = result["entity"]
+    key = key_order(entity["key"])
+    properties = entity.get("properties", {})
+    positions = []
+    for name, descending in order:
+        # An array is ordered by its smallest element ascending and by its largest one descending
+        orders = [(KEY, key)] if name == "__key__" else value_orders(properties.get(name))
+        position = (max(orders) if descending else min(orders)) if orders else ()
+        positions.append(_Descending(position) if descending else position)
+    return (*positions, key)
+
+
+def _normalize(value: Any) -> Any:
+    """
+    Hashable identity of a query in the wire format. Order of the filters of a composite filter does not matter
+    """
+    if isinstance(value, dict):
+        return frozenset((name, frozenset(map(_normalize, item)) if name == "filters" else _normalize(item))
+                         for name, item in value.items())
+    if isinstance(value, list):
+        return tuple(map(_normalize, value))
+    return value
 
 
 class Client:
     Batch: Type[Batch] = NotImplemented
     Transaction: Type[Transaction] = NotImplemented
-    _session: ClientSession = NotImplemented
-    __update_token_loop: asyncio.Task = NotImplemented
 
-    def __init__(self, credentials: Optional[str] = None) -> None:
+    def __init__(self, credentials: Optional[str] = None, commit_concurrency: int = COMMIT_CONCURRENCY,
+                 query_prefetch: int = QUERY_PREFETCH, query_concurrency: int = QUERY_CONCURRENCY,
+                 lookup_concurrency: int = LOOKUP_CONCURRENCY,
+                 coalesce_lookups: bool = False, coalesce_window: float = 0, cache: Optional[EntityCache] = None,
+                 codec: Optional[Codec] = None, dirty_only: bool = True, id_pool_size: int = ID_POOL_SIZE,
+                 id_pool_low_water: int = ID_POOL_LOW_WATER, id_pool_kinds: Iterable[Union[str, Tuple[str, Optional[str]]]] = (),
+                 token_cache: Optional[TokenCache] = None,
+                 retry: Optional[Dict[str, RetryPolicy]] = None, throttle: Optional[WriteThrottle] = None,
+                 metrics: Optional[Metrics] = None, endpoint: str = ENDPOINT, project_id: Optional[str] = None,
+                 transport: Optional[Transport] = None, query_cache: Optional[QueryCache] = None,
+                 buffer_size: int = COMMIT_MAX_MUTATIONS, buffer_interval: float = BUFFER_INTERVAL_S,
+                 buffer_max_pending: int = BUFFER_MAX_PENDING) -> None:
         """
         :param credentials: path to the service account credentials
         If not present will be attempted to receive with env GOOGLE_APPLICATION_CREDENTIALS
         This env will be automatically set if you use AppEngine or emulator of it
+        :param commit_concurrency: max number of commit requests a single non-transactional mutation set is sent with at once
+        :param query_prefetch: max number of query result pages requested ahead of the consumer
+        :param query_concurrency: max number of runQuery requests the queries merged by Client.query_merged are sent with at once
+        :param lookup_concurrency: max number of lookup requests a single set of keys is looked up with at once
+        :param coalesce_lookups: send single key lookups issued close in time together in one request
+        :param coalesce_window: seconds single key lookups are gathered for. By default, a single iteration of the event loop
+        :param cache: cache non-transactional lookups are served from. Is kept up to date with mutations made by the client
+        :param codec: JSON codec of the API Calls bodies. By default, the fastest installed one
+        :param dirty_only: do not commit updates and saves of entities that did not change since they were received or committed
+        :param id_pool_size: number of IDs preallocated at once for each kind and namespace
+        :param id_pool_low_water: number of preallocated IDs left that triggers allocation of more in the background
+        :param id_pool_kinds: kinds, or kinds and namespaces, whose pools are filled on connect.
+        Entities of other kinds can be constructed with prealocate only once their pool was filled with Client.ids.fill
+        :param token_cache: access token cache shared with the other processes of the host
+        :param retry: retry policies by the method of the API Call, override the ones of retry.default_retry
+        :param throttle: rate limit of the commits per kind, may be shared with other clients
+        :param metrics: receives measurements of the API Calls and of the serialization. Nothing is measured by default
+        :param endpoint: root URL of the Datastore API, e.g. of an emulator
+        :param project_id: required if the transport has no credentials. By default, the project of the credentials
+        :param transport: carries the API Calls, e.g. memory.MemoryTransport. By default, HTTP with the credentials
+        :param query_cache: cache non-transactional queries of a single kind are served from.
+        Is invalidated by mutations made by the client
+        :param buffer_size: number of mutations in the write-behind buffer that triggers their commit
+        :param buffer_interval: max seconds a mutation stays in the write-behind buffer
+        :param buffer_max_pending: number of mutations in the write-behind buffer writers wait at
         """
-        with open(getenv("GOOGLE_APPLICATION_CREDENTIALS") if credentials is None else credentials) as file:
-            credentials = json.load(file)
-            self.project_id = credentials.pop("project_id")
-            self.__token_uri = credentials.get("token_uri")
-            self.__private_key = credentials.get("private_key")
-            self.__client_email = credentials.get("client_email")
-
-        url = REQUEST_URL.format(project_id=self.project_id, method="{method}")
-        self.__allocate_ids_url = url.format(method="allocateIds")
-        self.__commit_url = url.format(method="commit")
-        self.__lookup_url = url.format(method="lookup")
-        self.__reserve_ids_url = url.format(method="reserveIds")
-        self.__run_query_url = url.format(method="runQuery")
-
+        self.commit_concurrency = commit_concurrency
+        self.query_prefetch = query_prefetch
+        self.query_concurrency = query_concurrency
+        self.lookup_concurrency = lookup_concurrency
+        self.coalesce_lookups = coalesce_lookups
+        self.coalesce_window = coalesce_window
+        self.cache = cache
+        self.query_cache = query_cache
+        self.codec = default_codec() if codec is None else codec
+        self.transport = HttpTransport(credentials, self.codec, endpoint, token_cache) if transport is None else transport
+        self.project_id = self.transport.project_id if project_id is None else project_id
+        if self.project_id is None:
+            raise ValueError("\"project_id\" should be specified for a transport without credentials")
+        self.dirty_only = dirty_only
+        self.throttle = throttle
+        self.metrics = metrics
+        self.retry = default_retry()
+        if retry is not None:
+            self.retry.update(retry)
+        self.ids = IdPool(self.__allocate_ids, size=id_pool_size, low_water=id_pool_low_water)
+        self.id_pool_kinds = tuple((kind, None) if isinstance(kind, str) else tuple(kind) for kind in id_pool_kinds)
+        self.buffer = WriteBuffer(self._execute, size=buffer_size, interval=buffer_interval, max_pending=buffer_max_pending)
+        self.__pending_lookups = {False: [], True: []}
+        self.__flushing = set()
         self.connected = False
-        self.Batch = type("Batch", (Batch,), {"__ds": self})
-        self.Transaction = type("Transaction", (Transaction,),
-                                {"__ds": self,
-                                 "__rollback_url": url.format(method="rollback"),
-                                 "__begin_transaction_url": url.format(method="beginTransaction")})
+        self.Batch = type("Batch", (Batch,), {"_Batch__ds": self})
+        self.Transaction = type("Transaction", (Transaction,), {"_Batch__ds": self, "_Transaction__ds": self})
 
     async def _execute(self, transaction: Optional[str] = None, update: Optional[Iterable[Kind, ...]] = None,
                        save: Optional[Iterable[Kind, ...]] = None, insert: Optional[Iterable[Kind, ...]] = None,
-                       delete: Optional[Iterable[Key, ...]] = None) -> Set[Union[Kind, Key]]:
-
-        def normalize(*ops: Optional[Iterable[Union[Kind, Key], ...]]) -> Iterable[Union[Kind, Key], ...]:
-            return (() if op is None else op for op in ops)
-
-        def mutations(**ops: Iterable[Union[Kind, Key, ...]]) -> Tuple[Dict[str: dict], ...]:
-            return tuple(mutation for group in (({method: op._to_entity(), "baseVersion": op._v} for op in operands)
-                                                for method, operands in ops.items()) for mutation in group)
-
-        update, save, insert, delete = normalize(update, save, insert, delete)
-        data = {"mode": "NON_TRANSACTIONAL" if transaction is None else "TRANSACTIONAL",
-                "mutations": mutations(update=update, upsert=save, insert=insert, delete=delete)}
+                       delete: Optional[Iterable[Union[Kind, Key], ...]] = None,
+                       concurrency: Optional[int] = None, dirty_only: Optional[bool] = None,
+                       optimistic: Optional[bool] = None) -> Set[Union[Kind, Key]]:
+        """
+        Uses "commit" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/commit
+        Non-transactional mutations are split into chunks within COMMIT_MAX_MUTATIONS and COMMIT_MAX_BYTES,
+        which are committed concurrently. Results of the chunks that succeeded are applied even if another one failed.
+        Chunks wait for Client.throttle, if set. Mutated kinds are invalidated in Client.query_cache, if it is set
+        :param concurrency: max number of chunks committed at once. Defaults to Client.commit_concurrency
+        :param dirty_only: skip updating and saving entities that did not change. Defaults to Client.dirty_only
+        :param optimistic: condition the mutations of entities on the versions they were read at ("baseVersion").
+        Defaults to Kind._optimistic of each entity. Transactional mutations are never conditioned,
+        the transaction detects the concurrent changes itself
+        :return: entities and keys a conflict was detected for
+        """
+        if self.dirty_only if dirty_only is None else dirty_only:
+            update = None if update is None else (op for op in update if op._dirty)
+            save = None if save is None else (op for op in save if op._dirty)
+
+        if transaction is not None:
+            optimistic = False
+
+        started = perf_counter()
+        ops = tuple((op, self._mutation(method, op, optimistic)) for method, operands in
+                    (("update", update), ("upsert", save), ("insert", insert), ("delete", delete))
+                    if operands is not None for op in operands)
+        if self.metrics is not None:
+            self.metrics.serialization("encode", perf_counter() - started, len(ops))
+        # A transaction is committed even without mutations, which ends it and releases its locks
+        if not ops and transaction is None:
+            return set()
+
+        data_tpl = {"mode": "NON_TRANSACTIONAL"} if transaction is None else {"mode": "TRANSACTIONAL", "transaction": transaction}
+        # A transaction has to be committed at once
+        chunks = ((ops, None),) if transaction is not None else tuple(self._chunks(ops))
+        semaphore = asyncio.Semaphore(self.commit_concurrency if concurrency is None else concurrency)
+
+        async def commit(chunk: Tuple[Tuple[Union[Kind, Key], dict], ...], parts: Optional[List[bytes]]) -> List[dict]:
+            if self.throttle is not None:
+                await self.throttle.acquire(Counter(_mutation_key(mutation)["path"][-1]["kind"] for _, mutation in chunk))
+            async with semaphore:
+                data = dict(data_tpl, mutations=[mutation for _, mutation in chunk])
+                # A transaction is retried as a whole, see Client.transaction
+                retry = None if transaction is not None or not all(map(self._idempotent, data["mutations"])) else self.retry["commit"]
+                prepared = None if parts is None else self.transport.prepare_parts(data_tpl, "mutations", parts)
+                return (await self._rpc("commit", data, retry, prepared))["mutationResults"]
+
+        responses = await asyncio.gather(*(commit(*chunk) for chunk in chunks), return_exceptions=True)
+        if self.query_cache is not None:
+            # Even the failed chunks might have been applied
+            for kind in {(key["partitionId"].get("namespaceId") or None, key["path"][-1]["kind"])
+                         for key in (_mutation_key(mutation) for _, mutation in ops)}:
+                self.query_cache.invalidate(kind)
 
         conflict = set()
-        async with self._session.post(self.__commit_url, json=data) as response:
-            print(await response.json())
-            if response.status is 200:
-                response = (await response.json())["mutationResults"]
-                for ops in update, save, insert, delete:
-                    for op in ops:
-                        mutation = response.pop(0)
-
-                        if transaction is not None:
-                            op._backup()
-
-                        if mutation.get("conflictDetected"):
-                            conflict.add(op)
-
-                        op._v = mutation["version"]
-                        key = mutation.get("key")
-                        if key is not None:
-                            op.key = Key._from_entity(key)
-
-                return conflict
-
-    async def _lookup(self) -> :
+        error = None
+        for (chunk, _), results in zip(chunks, responses):
+            if isinstance(results, BaseException):
+                error = error or results
+                if self.cache is not None:
+                    for op, _ in chunk:
+                        key = op if isinstance(op, Key) else op.key
+                        # Entities of partial keys were not cached
+                        if key.id_type is not None:
+                            self.cache.discard(key_order(key._entity))
+                continue
+
+            for (op, sent), mutation in zip(chunk, results):
+                if transaction is not None:
+                    op._backup()
+
+                if mutation.get("conflictDetected"):
+                    # The version of a conflict is the one of the concurrent change, which the entity does not hold
+                    conflict.add(op)
+                elif isinstance(op, Kind):
+                    # A deleted entity has to be saved anew
+                    op._dirty = "delete" in sent
+                    op._v = mutation.get("version")
+                    key = mutation.get("key")
+                    if key is not None:
+                        op.key = Key._from_entity(key)
+
+                if self.cache is not None:
+                    self.__cache_mutation(op, sent, mutation)
+
+        if error is not None:
+            raise error
+        return conflict
+
+    def __cache_mutation(self, op: Union[Kind, Key], sent: dict, mutation: dict) -> None:
+        path = key_order((op if isinstance(op, Key) else op.key)._entity)
+
+        if mutation.get("conflictDetected"):
+            self.cache.discard(path)
+        elif "delete" in sent:
+            self.cache.put(path, MISSING)
+        else:
+            entity = next(value for method, value in sent.items() if method != "baseVersion")
+            self.cache.put(path, {"entity": {"key": op.key._entity, "properties": entity["properties"]}, "version": mutation.get("version")})
+
+    @staticmethod
+    def _mutation(method: str, op: Union[Kind, Key], optimistic: Optional[bool] = None) -> dict:
+        if method == "delete":
+            mutation = {method: op._entity if isinstance(op, Key) else op.key._entity}
+        else:
+            mutation = {method: op._to_entity()}
+
+        if isinstance(op, Kind) and op._v is not None and (op._optimistic if optimistic is None else optimistic):
+            mutation["baseVersion"] = op._v
+        return mutation
+
+    async def save_merged(self, *entities: Kind, merge: Callable[[Kind], Optional[Awaitable]],
+                          retries: int = MERGE_RETRIES) -> Set[Kind]:
+        """
+        Uses "commit" API Call with mutation/operation "upsert" conditioned on the versions the entities were read at
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/commit#Mutation
+        Optimistic read-modify-write without a transaction: merge is applied to the entities, which are committed.
+        Entities a conflict was detected for are looked up anew and merge is applied to their stored state,
+        only they are committed again
+        :param entities: entities read from Datastore, without the changes of merge
+        :param merge: applies the changes to an entity, may be a coroutine function
+        :param retries: max number of times the conflicting entities are looked up anew
+        :return: entities still conflicting after the retries, and the ones deleted in the meantime
+        """
+        failed = set()
+        pending = entities
+        for attempt in range(retries + 1):
+            for entity in pending:
+                result = merge(entity)
+                if inspect.isawaitable(result):
+                    await result
+            conflict = await self._execute(save=pending, optimistic=True)
+            if not conflict or attempt == retries:
+                return failed | conflict
+
+            pending = tuple(conflict)
+            stored = await self.lookup_multiple(*pending)
+            for entity, state in zip(pending, stored):
+                if state is None:
+                    failed.add(entity)
+                else:
+                    entity._refresh(state)
+            pending = tuple(entity for entity in pending if entity not in failed)
+        return failed
+
+    @staticmethod
+    def _idempotent(mutation: dict) -> bool:
+        """
+        Whether a mutation has the same outcome if it is committed twice, so that its commit can be retried
+        """
+        if "insert" in mutation or "baseVersion" in mutation:
+            return False
+        # Partial keys are allocated anew with every commit
+        element = _mutation_key(mutation)["path"][-1]
+        return "id" in element or "name" in element
 
-    async def connect(self) -> None:
-        async def update_token_loop() -> None:
-            async with ClientSession(headers={"content-type": "application/x-www-form-urlencoded"}) as session:
-                while True:
-                    now = int(time())
-                    payload = {"aud": self.__token_uri,
-                               "iss": self.__client_email,
-                               "scope": "https://www.googleapis.com/auth/datastore",
-                               "iat": now,
-                               "exp": now + TOKEN_LIFETIME_S}
-                    data = {"grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
-                            "assertion": jwt.encode(payload, self.__private_key, algorithm="RS256")}
-
-                    async with session.post(self.__token_uri, data=urlencode(data)) as response:
-                        if response.status is 200:
-                            response = await response.json()
-
-                            self.connected = True
-                            self._session._default_headers.update(Authorization="Bearer " + response.get("access_token"))
-
-                            timeout = response.get("expires_in")
-                            if timeout > TOKEN_RENEW_BEFOREHAND_S:
-                                await asyncio.sleep(timeout - TOKEN_RENEW_BEFOREHAND_S)
-
-        self._session = ClientSession(connector=TCPConnector(limit=0), headers={"Content-Type": "application/json"})
-        self.__update_token_loop = asyncio.create_task(update_token_loop())
-        while not self.connected:
-            await asyncio.sleep(0.01)
+    def _chunks(self, ops: Iterable[Tuple[Union[Kind, Key], dict], ...]) -> Iterator[Tuple[tuple, Optional[List[bytes]]]]:
+        """
+        :return: chunks and the mutations of each one encoded with Client.transport, None if it does not serialize.
+        The encoded mutations make up the request body, see Transport.prepare_parts
+        """
+        chunk = []
+        parts = []
+        size = 0
+        for op, mutation in ops:
+            part = self.transport.encode(mutation)
+            # Plus a separator, so the estimation is exact
+            mutation_size = 0 if part is None else len(part) + 1
+            if chunk and (len(chunk) >= COMMIT_MAX_MUTATIONS or size + mutation_size > COMMIT_MAX_BYTES):
+                yield tuple(chunk), None if parts[0] is None else parts
+                chunk = []
+                parts = []
+                size = 0
+            chunk.append((op, mutation))
+            parts.append(part)
+            size += mutation_size
+        if chunk:
+            yield tuple(chunk), None if parts[0] is None else parts
+
+    async def connect(self, timeout: Optional[float] = CONNECT_TIMEOUT_S) -> None:
+        """
+        Fills the ID pools of Client.id_pool_kinds once connected
+        :param timeout: seconds to wait for the transport to connect, e.g. to receive an access token
+        :raise RequestFailed: if the access token was not granted or the IDs were not allocated
+        :raise ConnectionError: if the transport did not connect in time
+        """
+        if self.connected:
+            raise ConnectionError("Client is already connected")
+        await self.transport.connect(timeout)
+        self.connected = True
+        await asyncio.gather(*(self.ids.fill(kind, namespace) for kind, namespace in self.id_pool_kinds))
 
     async def disconnect(self) -> None:
+        """
+        Commits the mutations left in the write-behind buffer first
+        :raise RequestFailed: if their commit failed, the client is disconnected nevertheless
+        """
         if not self.connected:
             raise ConnectionError("Client is not connected")
 
-        self.__update_token_loop.cancel()
-        self.connected = False
-        await self._session.close()
-        self.__update_token_loop = self._session = NotImplemented
+        try:
+            await self.buffer.flush()
+        finally:
+            self.ids.close()
+            self.connected = False
+            await self.transport.disconnect()
 
-    async def preallocate(self, *partial_keys: Key) -> Optional[Tuple[Key]]:
-        async with self._session.post(self.__allocate_ids_url, json={"keys": partial_keys}) as response:
-            if response.status is 200:
-                return (await response.json()).get("keys")
+    async def _rpc(self, method: str, data: dict, retry: Optional[RetryPolicy] = None,
+                   prepared: Optional[Tuple[Any, int]] = None) -> dict:
+        """
+        Sends a Datastore API Call with Client.transport. The body is prepared once for all the attempts
+        :param method: of the API Call, e.g. "commit"
+        :param retry: policy the failed API Call is retried with. Not retried by default
+        :param prepared: body of the data already prepared by the transport, and its size
+        :raise RequestFailed: if the API Call did not succeed
+        """
+        body, size = self.transport.prepare(data) if prepared is None else prepared
+        if self.metrics is not None:
+            return await self.__measured_rpc(method, data, body, size, retry)
+        if retry is None:
+            return (await self.transport.send(method, body))[0]
+        return (await retry.call(lambda: self.transport.send(method, body)))[0]
+
+    async def __measured_rpc(self, method: str, data: dict, body: Any, size: int, retry: Optional[RetryPolicy]) -> dict:
+        attempts = 0
+
+        async def send() -> dict:
+            nonlocal attempts
+            attempts += 1
+            started = perf_counter()
+            try:
+                response, received = await self.transport.send(method, body)
+            except Exception as error:
+                self.metrics.rpc(method, perf_counter() - started, data, size, 0, None, getattr(error, "status", 0))
+                raise
+            self.metrics.rpc(method, perf_counter() - started, data, size, received, response, 200)
+            return response
+
+        try:
+            return await (send() if retry is None else retry.call(send))
+        finally:
+            if attempts > 1:
+                self.metrics.retries(method, attempts - 1)
+
+    async def preallocate(self, *partial_keys: Key) -> Tuple[Key, ...]:
+        """
+        Uses "allocateIds" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/allocateIds
+        :return: completed keys
+        """
+        response = await self._rpc("allocateIds", {"keys": [key._entity for key in partial_keys]},
+                                  self.retry["allocateIds"])
+        return tuple(Key._from_entity(key) for key in response.get("keys", ()))
+
+    async def __allocate_ids(self, kind: str, namespace: Optional[str], n: int) -> List[int]:
+        """
+        Allocates IDs for the pool. Requests of ALLOCATE_MAX_KEYS keys are sent at once
+        """
+        batches = await asyncio.gather(*(self.preallocate(*(Key(self.project_id, kind, namespace) for _ in range(size)))
+                                         for size in (min(ALLOCATE_MAX_KEYS, n - i) for i in range(0, n, ALLOCATE_MAX_KEYS))))
+        return [key.id for keys in batches for key in keys]
 
     async def reserve(self, *keys: Key) -> bool:
-        async with self._session.post(self.__reserve_ids_url, json={"keys": keys}) as response:
-            return True if response.status is 200 else False
+        """
+        Uses "reserveIds" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/reserveIds
+        """
+        try:
+            await self._rpc("reserveIds", {"keys": [key._entity for key in keys]}, self.retry["reserveIds"])
+        except RequestFailed:
+            return False
+        return True
 
     async def lookup_multiple(self, *keys: Union[Key, Kind], eventual: bool = False, transaction: Optional[str] = None,
-                              generator: bool = False) -> Optional[Union[Kind, Tuple[Kind]]]:
-        entities = []
-        data_tpl = {"readOptions": {"readConsistency": "EVENTUAL" if eventual else "STRONG"} if transaction is None
-                    else {"transaction": transaction}}
+                              concurrency: Optional[int] = None, kind: Optional[Type[Kind]] = None) -> Tuple[Optional[Kind], ...]:
+        """
+        Uses "lookup" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/lookup
+        Keys are split into shards of LOOKUP_MAX_KEYS which are looked up concurrently.
+        Deferred keys of a shard are retried with an exponential backoff without holding up the other shards.
+        Non-transactional lookups are served from Client.cache first, if it is set
+        :param keys: keys, or entities which are looked up as their class
+        :param concurrency: max number of lookup requests sent at once. Defaults to Client.lookup_concurrency
+        :param kind: class the entities of the keys are constructed as. By default, the one registered for their kind
+        :return: entities in the order of the keys, None for the ones that were not found
+        """
+        return await self.__lookup(tuple(key.key if isinstance(key, Kind) else key for key in keys),
+                                   tuple(type(key) if isinstance(key, Kind) else kind or Kind for key in keys),
+                                   eventual, transaction, concurrency)
 
-        while True:
-            async with self._session.post(self.__lookup_url, json=data_tpl.update(keys=keys)) as response:
-                if response.status is 200:
-                    response = await response.json()
-                    print(response)
-                    entities.extend(response.get("found", []))
-                    keys = response.get("deferred", [])
-
-                    if generator:
-                        while entities:
-                            yield Kind._from_entity(entities.pop(0))
-                    if not keys:
-                        if entities:
-                            yield (Kind._from_entity(entity) for entity in entities)
-                        return
+    async def __lookup(self, keys: Tuple[Key, ...], classes: Tuple[Type[Kind], ...], eventual: bool = False,
+                       transaction: Optional[str] = None, concurrency: Optional[int] = None) -> Tuple[Optional[Kind], ...]:
+        """
+        :param classes: class the entity of each key is constructed as, Kind for the one registered for its kind
+        """
+        paths = []
+        unique = {}
+        for key in keys:
+            key = key._entity
+            path = key_order(key)
+            paths.append(path)
+            unique[path] = key
+
+        found = {}
+        cache = self.cache if transaction is None else None
+        if cache is not None:
+            for path in tuple(unique):
+                entity = cache.get(path)
+                if entity is not None:
+                    del unique[path]
+                    if entity is not MISSING:
+                        found[path] = entity
+        unique = tuple(unique.values())
+
+        read_options = {"readConsistency": "EVENTUAL" if eventual else "STRONG"} if transaction is None else {"transaction": transaction}
+        semaphore = asyncio.Semaphore(self.lookup_concurrency if concurrency is None else concurrency)
+
+        async def lookup(shard: Tuple[dict, ...]) -> None:
+            backoff = LOOKUP_BACKOFF_S
+            while shard:
+                async with semaphore:
+                    content = await self._rpc("lookup", {"readOptions": read_options, "keys": shard}, self.retry["lookup"])
+
+                for entity in content.get("found", ()):
+                    path = key_order(entity["entity"]["key"])
+                    found[path] = entity
+                    if cache is not None:
+                        cache.put(path, entity)
+                if cache is not None:
+                    for entity in content.get("missing", ()):
+                        cache.put(key_order(entity["entity"]["key"]), MISSING)
+
+                shard = content.get("deferred")
+                if shard:
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, LOOKUP_MAX_BACKOFF_S)
+
+        await asyncio.gather(*(lookup(unique[i:i + LOOKUP_MAX_KEYS]) for i in range(0, len(unique), LOOKUP_MAX_KEYS)))
+        started = perf_counter()
+        entities = [None] * len(paths)
+        positions = {}
+        for i, (path, cls) in enumerate(zip(paths, classes)):
+            if path in found:
+                positions.setdefault(cls, []).append(i)
+        for cls, indexes in positions.items():
+            for i, entity in zip(indexes, cls._from_entities((found[paths[i]] for i in indexes), self)):
+                entities[i] = entity
+        entities = tuple(entities)
+        if self.metrics is not None:
+            self.metrics.serialization("decode", perf_counter() - started, len(found))
+        return entities
+
+    async def lookup(self, key: Union[Key, Kind], eventual: bool = False, kind: Optional[Type[Kind]] = None) -> Optional[Kind]:
+        """
+        Uses "lookup" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/lookup
+        If Client.coalesce_lookups is set, lookups issued within the same iteration of the event loop
+        (or within Client.coalesce_window) are sent together with Client.lookup_multiple
+        :param key: key, or entity which is looked up as its class
+        :param eventual: use eventual consistency
+        :param kind: class the entity is constructed as. By default, the one registered for the kind of the key
+        :return: found entity, None if it does not exist
+        """
+        if isinstance(key, Kind):
+            key, kind = key.key, type(key)
+        if not self.coalesce_lookups:
+            return (await self.lookup_multiple(key, eventual=eventual, kind=kind))[0]
+
+        loop = asyncio.get_running_loop()
+        pending = self.__pending_lookups[eventual]
+        if not pending:
+            if self.coalesce_window:
+                loop.call_later(self.coalesce_window, self.__flush_lookups, eventual)
+            else:
+                loop.call_soon(self.__flush_lookups, eventual)
+
+        future = loop.create_future()
+        pending.append((key, kind, future))
+        return await future
+
+    def __flush_lookups(self, eventual: bool) -> None:
+        pending = self.__pending_lookups[eventual]
+        self.__pending_lookups[eventual] = []
+
+        async def flush() -> None:
+            try:
+                entities = await self.__lookup(tuple(key for key, _, _ in pending),
+                                               tuple(kind or Kind for _, kind, _ in pending), eventual)
+            except Exception as error:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for (_, _, future), entity in zip(pending, entities):
+                    if not future.done():
+                        future.set_result(entity)
+
+        task = asyncio.create_task(flush())
+        self.__flushing.add(task)
+        task.add_done_callback(self.__flushing.discard)
+
+    def transaction(self, read_only: bool = False, retry_max: Optional[int] = 0, retry_timeout: Optional[float] = None,
+                    retry: Optional[RetryPolicy] = None):
+        """
+        Runs the decorated function in a transaction, which is retried if it fails
+        :param retry_max: max number of retries. None to retry until the deadline of the policy
+        :param retry_timeout: fixed delay between the retries instead of the backoff of the policy
+        :param retry: backoff and deadline of the retries. Defaults to Client.retry["transaction"]
+        """
+        policy = self.retry["transaction"] if retry is None else retry
 
-    def transaction(self, read_only: bool = False, retry_max: Optional[int] = 0, retry_timeout: Optional[float] = None):
         def wrap_wrap(function):
             @functools.wraps(function)
             async def wrap(*args, **kwargs):
                 retry_of = None
+                started = monotonic()
+                attempt = 0
                 while True:
                     try:
                         async with self.Transaction(read_only=read_only, retry=retry_of) as trans:
                             return await function(trans, *args, **kwargs)
                     except TransactionFailed as error:
-                        if retry_max is None or retry_max > 0:
-                            retry_of = error.id
-                            if retry_timeout is not None:
-                                await asyncio.sleep(retry_timeout)
-                        else:
+                        attempt += 1
+                        delay = policy.delay(attempt) if retry_timeout is None else retry_timeout
+                        if (retry_max is not None and attempt > retry_max) or policy.exhausted(attempt, started, delay):
                             raise error
+                        retry_of = error.id
+                        await asyncio.sleep(delay)
 
             return wrap
 
         return wrap_wrap
 
-    async def run_query(self, data):
-        results = []
-        start_cursor = None
-        while True:
-            async with aiohttp.ClientSession() as session:
-
-                if start_cursor is not None:
-                    data['query']['startCursor'] = start_cursor
-
-                async with session.post(
-                        self.__run_query_url,
-                        data=json.dumps(data),
-                        headers=await self._get_headers()) as resp:
-
-                    content = await resp.json()
-
-                    if resp.status == 200:
-
-                        entity_results = \
-                            content['batch'].get('entityResults', [])
-
-                        results.extend(entity_results)
-
-                        more_results = content['batch']['moreResults']
-
-                        if more_results in (
-                                'NO_MORE_RESULTS',
-                                'MORE_RESULTS_AFTER_LIMIT',
-                                'MORE_RESULTS_AFTER_CURSOR'):
-                            break
-
-                        if more_results == 'NOT_FINISHED':
-                            start_cursor = content['batch']['endCursor']
-                            continue
+    async def run_query(self, data: dict) -> List[dict]:
+        """
+        Uses "runQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runQuery
+        :param data: request body
+        :return: entity results of all the pages
+        """
+        return [entity async for page in self.__pages(data) for entity in page]
 
-                        raise ValueError(
-                            'Unexpected value for "moreResults": {}'
-                                .format(more_results))
+    async def run_aggregation(self, data: dict) -> Dict[str, Union[int, float, None]]:
+        """
+        Uses "runAggregationQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runAggregationQuery
+        Aggregations are split into requests of AGGREGATION_MAX, which are sent concurrently
+        :param data: request body
+        :return: values of the aggregations by alias
+        """
+        aggregation_query = data["aggregationQuery"]
+        aggregations = aggregation_query["aggregations"]
+
+        async def aggregate(shard: List[dict]) -> dict:
+            request = dict(data, aggregationQuery=dict(aggregation_query, aggregations=shard))
+            batch = (await self._rpc("runAggregationQuery", request, self.retry["runAggregationQuery"]))["batch"]
+            results = batch.get("aggregationResults")
+            return results[0]["aggregateProperties"] if results else {}
+
+        values = {}
+        for properties in await asyncio.gather(*(aggregate(aggregations[i:i + AGGREGATION_MAX])
+                                                 for i in range(0, len(aggregations), AGGREGATION_MAX))):
+            for alias, value in properties.items():
+                if "integerValue" in value:
+                    values[alias] = int(value["integerValue"])
+                elif "doubleValue" in value:
+                    values[alias] = float(value["doubleValue"])
+                else:
+                    values[alias] = None
+        return values
+
+    async def query(self, data: dict, prefetch: Optional[int] = None) -> AsyncIterator[dict]:
+        """
+        Uses "runQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runQuery
+        Yields entity results page by page, the following pages are requested while the current one is being consumed
+        :param data: request body
+        :param prefetch: max number of pages requested ahead. Defaults to Client.query_prefetch
+        """
+        async for page in self.query_pages(data, prefetch=prefetch):
+            for entity in page:
+                yield entity
 
-                    raise ValueError(
-                        'Error while query the datastore: {} ({})'
-                            .format(
-                            content.get('error', 'unknown'),
-                            resp.status
-                        )
-                    )
+    async def query_pages(self, data: dict, prefetch: Optional[int] = None,
+                          semaphore: Optional[asyncio.Semaphore] = None) -> AsyncIterator[List[dict]]:
+        """
+        Same as Client.query, but yields whole pages of entity results
+        :param semaphore: held by every runQuery request, e.g. to limit the requests of several queries at once
+        """
+        prefetch = self.query_prefetch if prefetch is None else prefetch
+        if prefetch < 1:
+            async for page in self.__pages(data, semaphore):
+                yield page
+            return
+
+        pages = asyncio.Queue(maxsize=prefetch)
+        closed = False
+
+        async def fetch() -> None:
+            try:
+                async for page in self.__pages(data, semaphore):
+                    # A cancellation swallowed by asyncio.wait_for of the retries would leave the fetch waiting for a free slot
+                    if closed:
+                        return
+                    await pages.put(page)
+                await pages.put(None)
+            except Exception as error:
+                await pages.put(error)
+
+        fetching = asyncio.create_task(fetch())
+        try:
+            while True:
+                page = await pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            closed = True
+            fetching.cancel()
+
+    async def query_merged(self, requests: Iterable[dict], order: Iterable[Tuple[str, bool]] = (), limit: Optional[int] = None,
+                           prefetch: Optional[int] = None, concurrency: Optional[int] = None) -> AsyncIterator[List[dict]]:
+        """
+        Uses "runQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runQuery
+        Runs the queries concurrently and merges their entity results in the order, entities found by several queries are
+        yielded once. Pages are yielded whenever the next result has to be waited for.
+        Queries still running once the limit is reached, or once the consumer stops, are cancelled
+        :param requests: request bodies, each query sorted by the order
+        :param order: names of the properties and whether they are sorted descending. Ties are ordered by key
+        :param limit: max number of entity results in total
+        :param prefetch: max number of pages requested ahead by each query. Defaults to Client.query_prefetch
+        :param concurrency: max number of runQuery requests sent at once. Defaults to Client.query_concurrency
+        """
+        order = tuple(order)
+        semaphore = asyncio.Semaphore(self.query_concurrency if concurrency is None else concurrency)
+        streams = [self.query_pages(data, prefetch=prefetch, semaphore=semaphore) for data in requests]
+
+        async def next_page(stream: AsyncIterator[List[dict]]) -> Optional[List[dict]]:
+            async for page in stream:
+                if page:
+                    return page
+            return None
+
+        try:
+            heap = []
+
+            def push(i: int, page: Optional[List[dict]], position: int) -> None:
+                if page is not None:
+                    heapq.heappush(heap, (_sort_key(page[position], order), i, position, page))
+
+            for i, page in enumerate(await asyncio.gather(*map(next_page, streams))):
+                push(i, page, 0)
+
+            seen = set()
+            merged = []
+            while heap:
+                _, i, position, page = heapq.heappop(heap)
+                result = page[position]
+                path = key_order(result["entity"]["key"])
+                if path not in seen:
+                    seen.add(path)
+                    merged.append(result)
+                    if limit is not None and len(seen) >= limit:
+                        break
+
+                if position + 1 < len(page):
+                    push(i, page, position + 1)
+                    continue
+                if merged:
+                    yield merged
+                    merged = []
+                push(i, await next_page(streams[i]), 0)
+
+            if merged:
+                yield merged
+        finally:
+            await asyncio.gather(*(stream.aclose() for stream in streams))
+
+    async def __pages(self, data: dict, semaphore: Optional[asyncio.Semaphore] = None) -> AsyncIterator[List[dict]]:
+        """
+        Non-transactional queries of a single kind are served from Client.query_cache, if it is set.
+        Results are cached once all of their pages are received
+        """
+        read_options = data.get("readOptions", {})
+        kinds = data["query"].get("kind", ())
+        if self.query_cache is None or "transaction" in read_options or len(kinds) != 1:
+            async for page in self.__fetch_pages(data, semaphore):
+                yield page
+            return
+
+        namespace = data.get("partitionId", {}).get("namespaceId") or None
+        query = (namespace, _normalize(data["query"]))
+        pages = self.query_cache.get(query, read_options.get("readConsistency") == "EVENTUAL")
+        if self.metrics is not None:
+            self.metrics.count("query_cache_requests_total", result="miss" if pages is None else "hit")
+        if pages is not None:
+            for page in pages:
+                yield page
+            return
+
+        kind = (namespace, kinds[0]["name"])
+        generation = self.query_cache.generation(kind)
+        pages = []
+        async for page in self.__fetch_pages(data, semaphore):
+            pages.append(page)
+            yield page
+        self.query_cache.put(query, kind, generation, pages)
+
+    async def __fetch_pages(self, data: dict, semaphore: Optional[asyncio.Semaphore] = None) -> AsyncIterator[List[dict]]:
+        query = dict(data["query"])
+        data = dict(data, query=query)
+        while True:
+            if semaphore is None:
+                batch = (await self._rpc("runQuery", data, self.retry["runQuery"]))["batch"]
+            else:
+                async with semaphore:
+                    batch = (await self._rpc("runQuery", data, self.retry["runQuery"]))["batch"]
+            entities = batch.get("entityResults", [])
+            yield entities
 
-        return results
+            more_results = batch["moreResults"]
+            if more_results in ("NO_MORE_RESULTS", "MORE_RESULTS_AFTER_LIMIT", "MORE_RESULTS_AFTER_CURSOR"):
+                return
+            if more_results != "NOT_FINISHED":
+                raise ValueError(f"Unexpected value for \"moreResults\": {more_results}")
 
+            query["startCursor"] = batch["endCursor"]
+            if "limit" in query:
+                query["limit"] -= len(entities)
 
 
 class Batch:
     __ds: Client = NotImplemented
 
-    def __init__(self) -> None:
-        self.__insert, self.__update, self.__save, self.__delete = set(), set(), set(), set()
+    def __init__(self, concurrency: Optional[int] = None, dirty_only: Optional[bool] = None) -> None:
+        """
+        :param concurrency: max number of commit requests sent at once. Defaults to Client.commit_concurrency
+        :param dirty_only: commit updates and saves only of entities that changed. Defaults to Client.dirty_only
+        """
+        self.__concurrency = concurrency
+        self.__dirty_only = dirty_only
+        # Method and operand by Key, so that an entity queued twice is committed once, with the last method
+        self.__ops: Dict[Key, Tuple[str, Union[Kind, Key]]] = {}
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.__ds._execute(update=self.__update, save=self.__save, insert=self.__insert, delete=self.__delete)
+        await self.__ds._execute(concurrency=self.__concurrency, dirty_only=self.__dirty_only, **self._ops)
+
+    @property
+    def _ops(self) -> dict:
+        ops = {"update": [], "save": [], "insert": [], "delete": []}
+        for method, op in self.__ops.values():
+            ops[method].append(op)
+        return ops
 
     def insert(self, entity: Kind) -> None:
-        self.__insert.add(entity)
+        self.__ops[entity.key] = ("insert", entity)
 
     def update(self, entity: Kind) -> None:
-        self.__update.add(entity)
+        self.__ops[entity.key] = ("update", entity)
 
     def save(self, entity: Kind) -> None:
-        self.__save.add(entity)
+        self.__ops[entity.key] = ("save", entity)
 
     def delete(self, entity: Union[Kind, Key]) -> None:
-        self.__delete.add(entity)
+        self.__ops[entity if isinstance(entity, Key) else entity.key] = ("delete", entity)
 
 
 class Transaction(Batch):
     __ds: Client = NotImplemented
-    __begin_transaction_url: str = NotImplemented
-    __rollback_url: str = NotImplemented
     __id: str = NotImplemented
     __conflict: Set[Union[Kind, Key], ...] = NotImplemented
 
     def __init__(self, read_only: bool = False, retry: Optional[str] = None):
+        """
+        :param read_only: the transaction only reads, it is neither committed nor rolled back
+        :param retry: ID of the transaction this one retries
+        """
         self.__read_only = read_only
         self.__retry = retry
+        # Entities read by the transaction by key path, None for the ones that were not found
+        self.__read: Dict[tuple, Optional[Kind]] = {}
         super().__init__()
 
+    @property
+    def id(self) -> str:
+        return self.__id
+
     async def __aenter__(self):
-        options = {"readOnly" if self.__read_only else "readWrite": {"previousTransaction": self.__retry}}
-        async with self.__session.post(self.__begin_transaction_url, json={"transactionOptions": options}) as response:
-            if response.status is not 200:
-                raise Exception
-            self.__id = (await response.json())["transaction"]
+        options = {"readOnly": {}} if self.__read_only else {"readWrite": {"previousTransaction": self.__retry}}
+        response = await self.__ds._rpc("beginTransaction", {"transactionOptions": options}, self.__ds.retry["beginTransaction"])
+        self.__id = response["transaction"]
+        return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if not self.__read_only:
-            self.__conflict = await self.__ds._execute(transaction=self.__id, update=self.__update, save=self.__save,
-                                                       insert=self.__insert, delete=self.__delete)
-            if self.__conflict:
-                async with self.__session.post(self.__rollback_url, json={"transaction": self.__id}) as response:
-                    if response is not 200:
-                        raise Exception
-
-                for entity in self.__conflict:
-                    entity._rollback()
-                    entity._clear_backup()
-
-                raise TransactionFailed(self.__id, "Transaction failed")
-            else:
-                for entity in self.__conflict:
-                    entity._clear_backup()
-
-    @property
-    def __session(self):
-        return self.__ds._session
-
-    async def lookup(self, *entities: Union[Kind, Key]) -> Optional[Tuple[Kind, ...]]:
-        return ...
\ No newline at end of file
+        if self.__read_only:
+            if exc_type is None and any(self._ops.values()):
+                raise ValueError("Read-only transaction can not mutate entities")
+            return
+
+        if exc_type is not None:
+            try:
+                await self.__ds._rpc("rollback", {"transaction": self.__id}, self.__ds.retry["rollback"])
+            except RequestFailed:
+                # The transaction expires anyway, the original error is the one worth raising
+                pass
+            return
+
+        try:
+            self.__conflict = await self.__ds._execute(transaction=self.__id, **self._ops)
+        except RequestFailed as error:
+            # Aborted because of the contention, the transaction is over and can be retried
+            if error.status == 409:
+                raise TransactionFailed(self.__id, "Transaction aborted") from error
+            raise
+        if self.__conflict:
+            await self.__ds._rpc("rollback", {"transaction": self.__id}, self.__ds.retry["rollback"])
+
+            for entity in self.__conflict:
+                entity._rollback()
+                entity._clear_backup()
+
+            raise TransactionFailed(self.__id, "Transaction failed")
+        else:
+            for entity in self.__conflict:
+                entity._clear_backup()
+
+    async def lookup(self, *entities: Union[Kind, Key]) -> Tuple[Optional[Kind], ...]:
+        """
+        Uses "lookup" API Call within the transaction
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/lookup
+        Keys that were not read by the transaction yet are looked up together, the ones that were are served
+        from memory: an entity read twice is the same instance
+        :return: entities in the order of the keys, None for the ones that were not found
+        """
+        paths = [key_order((entity.key if isinstance(entity, Kind) else entity)._entity) for entity in entities]
+        # Entities are looked up as their class
+        unread = {path: entity for path, entity in zip(paths, entities) if path not in self.__read}
+        if unread:
+            found = await self.__ds.lookup_multiple(*unread.values(), transaction=self.__id)
+            self.__read.update(zip(unread, found))
+        return tuple(self.__read[path] for path in paths)
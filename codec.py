@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Optional, Union
+
+
+class Codec:
+    """
+    JSON encoder and decoder of the bodies of Datastore API Calls
+    """
+
+    def __init__(self, dumps: Callable[[Any], Union[bytes, str]], loads: Callable[[bytes], Any], name: Optional[str] = None) -> None:
+        """
+        :param dumps: serializes an object to JSON, str results are encoded with utf-8
+        :param loads: deserializes JSON from bytes
+        """
+        self.name = name
+        self.__dumps = dumps
+        self.loads = loads
+
+    def dumps(self, value: Any) -> bytes:
+        value = self.__dumps(value)
+        return value.encode() if isinstance(value, str) else value
+
+
+def default_codec() -> Codec:
+    """
+    :return: codec of the fastest installed JSON library: orjson, ujson or the standard json
+    """
+    try:
+        import orjson
+        return Codec(orjson.dumps, orjson.loads, name="orjson")
+    except ImportError:
+        pass
+
+    try:
+        import ujson
+        return Codec(lambda value: ujson.dumps(value, ensure_ascii=False), ujson.loads, name="ujson")
+    except ImportError:
+        pass
+
+    return Codec(lambda value: json.dumps(value, ensure_ascii=False, separators=(",", ":")), json.loads, name="json")
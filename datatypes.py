@@ -7,13 +7,19 @@ if TYPE_CHECKING:
 
 
 class Key:
+    """
+    Keys are hashable and compare by value once complete, a partial key is only equal to itself.
+    A key should not be mutated other than with _complete/_uncomplete while it is in a set or a dict
+    """
+    __slots__ = ("kind", "project", "namespace", "partial", "id", "id_type", "_backup_state", "_wire")
+
     def __init__(self, project: str, kind: str, namespace: Optional[str] = None, id: Optional[int] = None, name: Optional[str] = None) -> None:
         self.kind = kind
         self.project = project
         self.namespace = namespace
         self.partial = True
-        self._backup_id = None
-        self._backup_id_type = None
+        self._backup_state = None
+        self._wire = None
 
         try:
             self._complete(id, name)
@@ -21,34 +27,70 @@ class Key:
             self.id = None
             self.id_type = None
 
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Key):
+            return NotImplemented
+        if self.id_type is None or other.id_type is None:
+            return self is other
+        return (self.id == other.id and self.id_type == other.id_type and self.kind == other.kind and
+                self.namespace == other.namespace and self.project == other.project)
+
+    def __hash__(self) -> int:
+        if self.id_type is None:
+            return object.__hash__(self)
+        return hash((self.project, self.namespace, self.kind, self.id))
+
+    def __repr__(self) -> str:
+        return f"Key({self.kind!r}, {self.id_type}={self.id!r}, namespace={self.namespace!r})"
+
     def _backup(self) -> None:
-        self._backup_id = self.id
-        self._backup_id_type = self.id_type
+        self._backup_state = (self.id, self.id_type)
 
     def _rollback(self) -> None:
-        if self._backup_id is not None:
-            self.id = self._backup_id
-        if self._backup_id_type is not None:
-            self.id_type = self._backup_id_type
+        if self._backup_state is not None:
+            id, id_type = self._backup_state
+            if id is not None:
+                self.id = id
+            if id_type is not None:
+                self.id_type = id_type
+            self._wire = None
 
     def _clear_backup(self) -> None:
-        self._backup_id = None
-        self._backup_id_type = None
+        self._backup_state = None
 
     @property
     def _entity(self) -> dict:
-        partition = {"projectId": self.project, "namespaceId": self.namespace}
-        path = [{"kind": self.kind}]
-        if self.id_type is not None:
-            path[0].update({self.id_type: self.id})
-        return {"partitionId": partition, "path": path}
+        """
+        Key in the wire format. Is cached, so it should not be mutated
+        """
+        if self._wire is None:
+            path = {"kind": self.kind}
+            if self.id_type is not None:
+                path[self.id_type] = self.id
+            self._wire = {"partitionId": {"projectId": self.project, "namespaceId": self.namespace}, "path": [path]}
+        return self._wire
 
     @classmethod
     def _from_entity(cls, entity: dict) -> Key:
-        partition = entity.get("partitionId")
-        path = entity.get("path")[0]
-        return cls(project=partition.get("projectId"), namespace=partition.get("namespaceId"), id=path.get("id"), name=path.get("name"),
-                   kind=path.get("kind"))
+        # Keys received from Datastore are well-formed, so the checks of Key.__init__ and Key._complete are skipped
+        partition = entity["partitionId"]
+        path = entity["path"][0]
+        key = cls.__new__(cls)
+        key.kind = path["kind"]
+        key.project = partition.get("projectId")
+        key.namespace = partition.get("namespaceId")
+        key.partial = True
+        key._backup_state = None
+        key._wire = None
+        if "id" in path:
+            key.id = int(path["id"])
+            key.id_type = "id"
+        elif "name" in path:
+            key.id = path["name"]
+            key.id_type = "name"
+        else:
+            key.id = key.id_type = None
+        return key
 
     def _complete(self, id: Optional[int] = None, name: Optional[str] = None) -> None:
         if not self.partial:
@@ -62,32 +104,104 @@ class Key:
         else:
             self.id = name
             self.id_type = "name"
+        self._wire = None
 
     def _uncomplete(self) -> None:
         self.id = None
         self.id_type = None
         self.partial = True
+        self._wire = None
 
 
 class Array(list):
+    """
+    Mutations are reported to the Kind or Embedded instance the Array belongs to
+    """
+    __slots__ = ("_content", "_parent")
+
     def __init__(self, content: Field, iterable: Iterable) -> None:
         self._content = content
-        super().__init__(self._content._mold(value) for value in iterable)
+        self._parent = None
+        super().__init__(self._adopt(self._content._mold(value)) for value in iterable)
+
+    @classmethod
+    def _from_values(cls, content: Field, values: Iterable) -> Array:
+        """
+        Constructs an Array of values that are already molded by the content field
+        """
+        array = cls.__new__(cls)
+        array._content = content
+        array._parent = None
+        list.extend(array, values)
+        if content._container:
+            for value in array:
+                if value is not None:
+                    value._parent = array
+        return array
+
+    def _adopt(self, value: Any) -> Any:
+        if self._content._container and value is not None:
+            value._parent = self
+        return value
+
+    def _touch(self) -> None:
+        if self._parent is not None:
+            self._parent._touch()
 
     def __setitem__(self, key: int, value: Any) -> None:
-        super().__setitem__(key, self._content._mold(value))
+        super().__setitem__(key, self._adopt(self._content._mold(value)))
+        self._touch()
+
+    def __delitem__(self, key: int) -> None:
+        super().__delitem__(key)
+        self._touch()
+
+    def __iadd__(self, iterable: Iterable) -> Array:
+        self.extend(iterable)
+        return self
+
+    def __imul__(self, n: int) -> Array:
+        super().__imul__(n)
+        self._touch()
+        return self
 
     def append(self, value: Any) -> None:
-        super().append(self._content._mold(value))
+        super().append(self._adopt(self._content._mold(value)))
+        self._touch()
 
     def extend(self, iterable: Iterable) -> None:
-        super().extend(self._content._mold(value) for value in iterable)
+        super().extend(self._adopt(self._content._mold(value)) for value in iterable)
+        self._touch()
 
     def insert(self, index: int, value: Any) -> None:
-        super().insert(index, self._content._mold(value))
+        super().insert(index, self._adopt(self._content._mold(value)))
+        self._touch()
+
+    def pop(self, index: int = -1) -> Any:
+        value = super().pop(index)
+        self._touch()
+        return value
+
+    def remove(self, value: Any) -> None:
+        super().remove(value)
+        self._touch()
+
+    def clear(self) -> None:
+        super().clear()
+        self._touch()
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        super().sort(*args, **kwargs)
+        self._touch()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self._touch()
 
 
 class Location:
+    __slots__ = ("latitude", "longitude")
+
     def __init__(self, latitude: float, longitude: float) -> None:
         self.latitude = latitude
         self.longitude = longitude
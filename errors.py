@@ -1,5 +1,20 @@
+from typing import Optional
+
 
 class TransactionFailed(Exception):
     def __init__(self, id: str, *args):
         self.id = id
         super().__init__(*args)
+
+
+class RequestFailed(Exception):
+    def __init__(self, status: int, *args):
+        self.status = status
+        super().__init__(*args)
+
+
+class IdPoolExhausted(Exception):
+    def __init__(self, kind: str, namespace: Optional[str], *args):
+        self.kind = kind
+        self.namespace = namespace
+        super().__init__(*args)
@@ -0,0 +1,509 @@
+from __future__ import annotations
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_left, bisect_right, insort
+from itertools import count, product
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+import json
+
+from .errors import RequestFailed
+from .ordering import KEY, key_order, value_order, value_orders
+from .transport import Transport
+
+# Max number of aggregations of a single aggregation query
+_AGGREGATIONS_MAX = 5
+
+_RANGE_OPS = {"EQUAL", "LESS_THAN", "LESS_THAN_OR_EQUAL", "GREATER_THAN", "GREATER_THAN_OR_EQUAL"}
+
+
+class _Max:
+    """
+    Greater than anything, bounds a range of index entries from above
+    """
+
+    def __lt__(self, other: Any) -> bool:
+        return False
+
+    def __gt__(self, other: Any) -> bool:
+        return True
+
+
+_MAX = _Max()
+
+
+def _clone(value: Any) -> Any:
+    # Values are JSON-like, which is several times faster to copy than with copy.deepcopy
+    value_type = type(value)
+    if value_type is dict:
+        return {name: _clone(item) for name, item in value.items()}
+    if value_type is list:
+        return [_clone(item) for item in value]
+    return value
+
+
+def _complete(key: dict) -> bool:
+    element = key["path"][-1]
+    return "id" in element or "name" in element
+
+
+class _Entity:
+    __slots__ = ("key", "path", "properties", "version", "orders")
+
+    def __init__(self, key: dict, path: tuple, properties: dict, version: int) -> None:
+        self.key = key
+        self.path = path
+        self.properties = properties
+        self.version = version
+        self.orders = {name: value_orders(value) for name, value in properties.items()}
+        self.orders["__key__"] = [(KEY, path)]
+
+    def result(self, projection: Optional[List[str]] = None) -> dict:
+        if projection is None:
+            entity = {"key": _clone(self.key), "properties": _clone(self.properties)}
+        elif projection == ["__key__"]:
+            entity = {"key": _clone(self.key)}
+        else:
+            entity = {"key": _clone(self.key),
+                      "properties": {name: _clone(self.properties[name]) for name in projection if name in self.properties}}
+        return {"entity": entity, "version": str(self.version)}
+
+
+class _Row:
+    """
+    Result of a projection query. An entity has a row for every combination of the elements of its projected arrays
+    """
+    __slots__ = ("entity", "properties")
+
+    def __init__(self, entity: _Entity, properties: dict) -> None:
+        self.entity = entity
+        self.properties = properties
+
+    @property
+    def path(self) -> tuple:
+        return self.entity.path
+
+    def result(self, projection: Optional[List[str]] = None) -> dict:
+        return {"entity": {"key": _clone(self.entity.key), "properties": _clone(self.properties)},
+                "version": str(self.entity.version)}
+
+
+def _rows(entity: _Entity, projection: List[str]) -> Iterator[_Row]:
+    """
+    :return: rows of the projection of an entity, none if it lacks an indexed value of a projected property
+    """
+    names = [name for name in projection if name != "__key__"]
+    elements = []
+    for name in names:
+        value = entity.properties.get(name)
+        if value is None or value.get("excludeFromIndexes"):
+            return
+        elements.append(value["arrayValue"].get("values", ()) if "arrayValue" in value else (value,))
+    for values in product(*elements):
+        yield _Row(entity, dict(zip(names, values)))
+
+
+class _Transaction:
+    __slots__ = ("started", "read_only", "paths")
+
+    def __init__(self, started: int, read_only: bool) -> None:
+        self.started = started
+        self.read_only = read_only
+        # Entities read and written by the transaction, a change of any of them by another one aborts the commit
+        self.paths: Set[tuple] = set()
+
+
+class MemoryDatastore:
+    """
+    In-memory engine implementing the Datastore API Calls on request and response bodies of the REST API.
+    Properties are kept in sorted indexes which filtered and ordered queries are served from.
+    Transactions are optimistic: a commit is aborted if an entity the transaction read or writes
+    was changed by another commit since the transaction began
+    """
+
+    def __init__(self, page_size: int = 300, lookup_page: Optional[int] = None) -> None:
+        """
+        :param page_size: max number of entity results in a query response
+        :param lookup_page: max number of entities found by a lookup, the rest is deferred. Not limited by default
+        """
+        self.page_size = page_size
+        self.lookup_page = lookup_page
+        self.__entities: Dict[tuple, _Entity] = {}
+        # Sorted paths by namespace and kind
+        self.__kinds: Dict[Tuple[str, str], List[tuple]] = {}
+        # Sorted (position of the value, path) by namespace, kind and property name
+        self.__indexes: Dict[Tuple[str, str, str], List[Tuple[tuple, tuple]]] = {}
+        # Version of the last commit which changed an entity, deleted ones included
+        self.__changed: Dict[tuple, int] = {}
+        self.__transactions: Dict[str, _Transaction] = {}
+        self.__version = 0
+        self.__ids = count(1)
+        self.__transaction_ids = count(1)
+        self.__results: Dict[str, Tuple[int, List[Union[_Entity, _Row]]]] = {}
+        self.__methods: Dict[str, Callable[[dict], dict]] = {
+            "allocateIds": self.allocate_ids,
+            "beginTransaction": self.begin_transaction,
+            "commit": self.commit,
+            "lookup": self.lookup,
+            "reserveIds": self.reserve_ids,
+            "rollback": self.rollback,
+            "runQuery": self.run_query,
+            "runAggregationQuery": self.run_aggregation_query,
+        }
+
+    def __len__(self) -> int:
+        return len(self.__entities)
+
+    def call(self, method: str, body: dict) -> dict:
+        """
+        :raise RequestFailed: with the status Datastore would respond with
+        """
+        handler = self.__methods.get(method)
+        if handler is None:
+            raise RequestFailed(404, f"Datastore API Call failed: method \"{method}\" is not supported")
+        return handler(body)
+
+    def clear(self) -> None:
+        self.__entities.clear()
+        self.__kinds.clear()
+        self.__indexes.clear()
+        self.__changed.clear()
+        self.__transactions.clear()
+        self.__results.clear()
+
+    def allocate_ids(self, body: dict) -> dict:
+        keys = _clone(body.get("keys", []))
+        for key in keys:
+            if _complete(key):
+                raise RequestFailed(400, "Datastore API Call failed: INVALID_ARGUMENT, a key is complete")
+            key["path"][-1]["id"] = str(next(self.__ids))
+        return {"keys": keys}
+
+    def reserve_ids(self, body: dict) -> dict:
+        reserved = max((element.get("id", 0) for key in body.get("keys", ()) for element in key["path"]), key=int, default=0)
+        self.__reserve(int(reserved))
+        return {}
+
+    def __reserve(self, reserved: int) -> None:
+        # IDs are allocated in sequence, so they are reserved by moving the sequence past them
+        current = next(self.__ids)
+        self.__ids = count(max(current, reserved + 1))
+
+    def begin_transaction(self, body: dict) -> dict:
+        options = body.get("transactionOptions", {})
+        transaction = urlsafe_b64encode(str(next(self.__transaction_ids)).encode()).decode()
+        self.__transactions[transaction] = _Transaction(self.__version, "readOnly" in options)
+        return {"transaction": transaction}
+
+    def rollback(self, body: dict) -> dict:
+        self.__transaction(body["transaction"], pop=True)
+        return {}
+
+    def lookup(self, body: dict) -> dict:
+        transaction = body.get("readOptions", {}).get("transaction")
+        transaction = None if transaction is None else self.__transaction(transaction)
+
+        found, missing, deferred = [], [], []
+        for key in body.get("keys", ()):
+            if self.lookup_page is not None and len(found) >= self.lookup_page:
+                deferred.append(_clone(key))
+                continue
+            path = key_order(key)
+            if transaction is not None:
+                transaction.paths.add(path)
+            entity = self.__entities.get(path)
+            if entity is None:
+                missing.append({"entity": {"key": _clone(key)}, "version": str(self.__version)})
+            else:
+                found.append(entity.result())
+
+        response = {"found": found, "missing": missing}
+        if deferred:
+            response["deferred"] = deferred
+        return response
+
+    def commit(self, body: dict) -> dict:
+        transaction = None
+        if body.get("mode") == "TRANSACTIONAL":
+            transaction = self.__transaction(body.get("transaction"), pop=True)
+            if transaction.read_only:
+                raise RequestFailed(400, "Datastore API Call failed: INVALID_ARGUMENT, the transaction is read-only")
+
+        mutations = []
+        paths = set()
+        for mutation in body.get("mutations", ()):
+            (method, value), = ((method, value) for method, value in mutation.items() if method != "baseVersion")
+            key = _clone(value if method == "delete" else value["key"])
+            if not _complete(key):
+                if method not in ("insert", "upsert"):
+                    raise RequestFailed(400, f"Datastore API Call failed: INVALID_ARGUMENT, {method} of a partial key")
+                key["path"][-1]["id"] = str(next(self.__ids))
+            elif "id" in key["path"][-1]:
+                # An explicit ID is never allocated afterwards
+                self.__reserve(int(key["path"][-1]["id"]))
+            path = key_order(key)
+            if path in paths:
+                raise RequestFailed(400, "Datastore API Call failed: INVALID_ARGUMENT, an entity is mutated more than once")
+            paths.add(path)
+
+            exists = path in self.__entities
+            if method == "insert" and exists:
+                raise RequestFailed(409, f"Datastore API Call failed: ALREADY_EXISTS, entity {key['path']} already exists")
+            if method == "update" and not exists:
+                raise RequestFailed(404, f"Datastore API Call failed: NOT_FOUND, entity {key['path']} does not exist")
+            mutations.append((method, value, key, path, mutation.get("baseVersion")))
+
+        if transaction is not None:
+            for path in paths | transaction.paths:
+                if self.__changed.get(path, 0) > transaction.started:
+                    raise RequestFailed(409, "Datastore API Call failed: ABORTED, too much contention on these datastore entities")
+
+        self.__version += 1
+        results = []
+        for method, value, key, path, base_version in mutations:
+            entity = self.__entities.get(path)
+            current = 0 if entity is None else entity.version
+            if base_version is not None and int(base_version) != current:
+                results.append({"conflictDetected": True, "version": str(current)})
+                continue
+
+            self.__remove(path)
+            if method != "delete":
+                self.__put(_Entity(key, path, _clone(value.get("properties", {})), self.__version))
+            self.__changed[path] = self.__version
+
+            result = {"version": str(self.__version)}
+            if method != "delete" and not _complete(value["key"]):
+                result["key"] = _clone(key)
+            results.append(result)
+        return {"mutationResults": results, "indexUpdates": 0}
+
+    def run_query(self, body: dict) -> dict:
+        if "gqlQuery" in body:
+            raise RequestFailed(400, "Datastore API Call failed: INVALID_ARGUMENT, GQL queries are not supported")
+        query = body["query"]
+        transaction = body.get("readOptions", {}).get("transaction")
+        transaction = None if transaction is None else self.__transaction(transaction)
+        namespace = body.get("partitionId", {}).get("namespaceId") or ""
+
+        entities = self.__query(namespace, query)
+        start = int(urlsafe_b64decode(query["startCursor"]).decode()) if query.get("startCursor") else query.get("offset", 0)
+        limit = query.get("limit")
+        size = self.page_size if limit is None else min(self.page_size, limit)
+        page = entities[start:start + size]
+        end = start + len(page)
+
+        if end >= len(entities):
+            more = "NO_MORE_RESULTS"
+        elif limit is not None and len(page) >= limit:
+            more = "MORE_RESULTS_AFTER_LIMIT"
+        else:
+            more = "NOT_FINISHED"
+
+        projection = [projection["property"]["name"] for projection in query.get("projection", ())] or None
+        if transaction is not None:
+            transaction.paths.update(entity.path for entity in page)
+        return {"batch": {"entityResultType": "FULL" if projection is None else "KEY_ONLY" if projection == ["__key__"] else "PROJECTION",
+                          "entityResults": [entity.result(projection) for entity in page],
+                          "endCursor": urlsafe_b64encode(str(end).encode()).decode(),
+                          "moreResults": more}}
+
+    def run_aggregation_query(self, body: dict) -> dict:
+        if "gqlQuery" in body:
+            raise RequestFailed(400, "Datastore API Call failed: INVALID_ARGUMENT, GQL queries are not supported")
+        aggregation_query = body["aggregationQuery"]
+        aggregations = aggregation_query.get("aggregations", ())
+        if not 0 < len(aggregations) <= _AGGREGATIONS_MAX:
+            raise RequestFailed(400, f"Datastore API Call failed: INVALID_ARGUMENT, 1 to {_AGGREGATIONS_MAX} aggregations are allowed")
+        query = aggregation_query["nestedQuery"]
+        transaction = body.get("readOptions", {}).get("transaction")
+        transaction = None if transaction is None else self.__transaction(transaction)
+        namespace = body.get("partitionId", {}).get("namespaceId") or ""
+
+        entities = self.__query(namespace, query)
+        start = query.get("offset", 0)
+        entities = entities[start:] if query.get("limit") is None else entities[start:start + query["limit"]]
+        if transaction is not None:
+            transaction.paths.update(entity.path for entity in entities)
+
+        properties = {}
+        for aggregation in aggregations:
+            if "count" in aggregation:
+                up_to = aggregation["count"].get("upTo")
+                properties[aggregation["alias"]] = {"integerValue": str(len(entities) if up_to is None else min(len(entities), int(up_to)))}
+                continue
+
+            operator = "sum" if "sum" in aggregation else "avg"
+            name = aggregation[operator]["property"]["name"]
+            # Values other than numbers are skipped
+            values = [value for value in (entity.properties.get(name) for entity in entities)
+                      if value is not None and ("integerValue" in value or "doubleValue" in value)]
+            total = sum(int(value["integerValue"]) if "integerValue" in value else float(value["doubleValue"]) for value in values)
+            if operator == "avg":
+                properties[aggregation["alias"]] = {"doubleValue": total / len(values)} if values else {"nullValue": None}
+            elif all("integerValue" in value for value in values):
+                properties[aggregation["alias"]] = {"integerValue": str(total)}
+            else:
+                properties[aggregation["alias"]] = {"doubleValue": float(total)}
+        return {"batch": {"aggregationResults": [{"aggregateProperties": properties}], "moreResults": "NO_MORE_RESULTS"}}
+
+    def __transaction(self, transaction: Optional[str], pop: bool = False) -> _Transaction:
+        state = self.__transactions.pop(transaction, None) if pop else self.__transactions.get(transaction)
+        if state is None:
+            raise RequestFailed(400, "Datastore API Call failed: INVALID_ARGUMENT, the transaction is not active")
+        return state
+
+    def __put(self, entity: _Entity) -> None:
+        namespace, *_, (kind, _, _) = entity.path
+        self.__entities[entity.path] = entity
+        insort(self.__kinds.setdefault((namespace, kind), []), entity.path)
+        for name, orders in entity.orders.items():
+            if name != "__key__":
+                index = self.__indexes.setdefault((namespace, kind, name), [])
+                for order in orders:
+                    insort(index, (order, entity.path))
+
+    def __remove(self, path: tuple) -> None:
+        entity = self.__entities.pop(path, None)
+        if entity is None:
+            return
+        namespace, *_, (kind, _, _) = path
+        paths = self.__kinds[(namespace, kind)]
+        del paths[bisect_left(paths, path)]
+        for name, orders in entity.orders.items():
+            if name != "__key__":
+                index = self.__indexes[(namespace, kind, name)]
+                for order in orders:
+                    del index[bisect_left(index, (order, path))]
+
+    def __query(self, namespace: str, query: dict) -> List[Union[_Entity, _Row]]:
+        """
+        :return: all the entities matching the query in its order, their rows for a projection query.
+        Cached until the next commit, so that the following pages of a query are not evaluated anew
+        """
+        cache_key = json.dumps([namespace, {name: value for name, value in query.items()
+                                            if name not in ("startCursor", "limit", "offset")}], sort_keys=True)
+        cached = self.__results.get(cache_key)
+        if cached is not None and cached[0] == self.__version:
+            return cached[1]
+
+        kinds = query.get("kind", ())
+        if len(kinds) != 1:
+            raise RequestFailed(400, "Datastore API Call failed: INVALID_ARGUMENT, exactly one kind should be queried")
+        kind = kinds[0]["name"]
+
+        condition = query.get("filter")
+        entities = self.__candidates(namespace, kind, condition)
+        if condition is not None:
+            entities = (entity for entity in entities if _matches(entity, condition))
+
+        orders = [(order["property"]["name"], order.get("direction", "ASCENDING") == "DESCENDING") for order in query.get("order", ())]
+        entities = [entity for entity in entities if all(entity.orders.get(name) for name, _ in orders)]
+        # Stable sorts from the last order to the first one, the candidates are already sorted by key
+        for name, descending in reversed(orders):
+            entities.sort(key=(lambda entity: max(entity.orders[name])) if descending else (lambda entity: min(entity.orders[name])),
+                          reverse=descending)
+
+        projection = [projection["property"]["name"] for projection in query.get("projection", ())]
+        if projection and projection != ["__key__"]:
+            entities = [row for entity in entities for row in _rows(entity, projection)]
+
+        distinct = [property["name"] for property in query.get("distinctOn", ())]
+        if distinct:
+            seen = set()
+            entities = [entity for entity in entities if _first(seen, tuple(json.dumps(entity.properties.get(name), sort_keys=True)
+                                                                             for name in distinct))]
+
+        if len(self.__results) >= 64:
+            self.__results.clear()
+        self.__results[cache_key] = (self.__version, entities)
+        return entities
+
+    def __candidates(self, namespace: str, kind: str, condition: Optional[dict]) -> Iterator[_Entity]:
+        """
+        :return: entities of a kind sorted by key, narrowed down with the index of a property filter if there is one
+        """
+        property_filter = None
+        if condition is not None:
+            filters = [condition]
+            if "compositeFilter" in condition and condition["compositeFilter"].get("op", "AND") == "AND":
+                filters = condition["compositeFilter"]["filters"]
+            property_filter = next((nested["propertyFilter"] for nested in filters if "propertyFilter" in nested and
+                                    nested["propertyFilter"]["op"] in _RANGE_OPS and
+                                    nested["propertyFilter"]["property"]["name"] != "__key__"), None)
+
+        if property_filter is None:
+            return (self.__entities[path] for path in self.__kinds.get((namespace, kind), ()))
+
+        index = self.__indexes.get((namespace, kind, property_filter["property"]["name"]), [])
+        order = value_order(property_filter["value"])
+        op = property_filter["op"]
+        low, high = 0, len(index)
+        if order is not None:
+            if op in ("EQUAL", "GREATER_THAN_OR_EQUAL"):
+                low = bisect_left(index, (order,))
+            elif op == "GREATER_THAN":
+                low = bisect_right(index, (order, _MAX))
+            if op in ("EQUAL", "LESS_THAN_OR_EQUAL"):
+                high = bisect_right(index, (order, _MAX))
+            elif op == "LESS_THAN":
+                high = bisect_left(index, (order,))
+        return (self.__entities[path] for path in sorted({path for _, path in index[low:high]}))
+
+
+def _first(seen: set, value: Any) -> bool:
+    if value in seen:
+        return False
+    seen.add(value)
+    return True
+
+
+def _matches(entity: _Entity, condition: dict) -> bool:
+    if "compositeFilter" in condition:
+        composite = condition["compositeFilter"]
+        nested = (_matches(entity, nested) for nested in composite.get("filters", ()))
+        return any(nested) if composite.get("op") == "OR" else all(nested)
+
+    condition = condition["propertyFilter"]
+    name = condition["property"]["name"]
+    op = condition["op"]
+    orders = entity.orders.get(name)
+    if not orders:
+        return False
+
+    if op == "HAS_ANCESTOR":
+        ancestor = key_order(condition["value"]["keyValue"])
+        return entity.path[:len(ancestor)] == ancestor
+    if op in ("IN", "NOT_IN"):
+        values = {value_order(value) for value in condition["value"]["arrayValue"].get("values", ())}
+        return any((order in values) is (op == "IN") for order in orders)
+
+    value = value_order(condition["value"])
+    if op == "EQUAL":
+        return value in orders
+    if op == "NOT_EQUAL":
+        return any(order != value for order in orders)
+    # Values of different types are never in a range of each other
+    orders = [order for order in orders if order[0] == value[0]]
+    if op == "LESS_THAN":
+        return any(order < value for order in orders)
+    if op == "LESS_THAN_OR_EQUAL":
+        return any(order <= value for order in orders)
+    if op == "GREATER_THAN":
+        return any(order > value for order in orders)
+    if op == "GREATER_THAN_OR_EQUAL":
+        return any(order >= value for order in orders)
+    raise RequestFailed(400, f"Datastore API Call failed: INVALID_ARGUMENT, operator {op} is not supported")
+
+
+class MemoryTransport(Transport):
+    """
+    Serves the API Calls of a client in-process with a MemoryDatastore, without HTTP and serialization.
+    Several clients may share one engine
+    """
+
+    def __init__(self, datastore: Optional[MemoryDatastore] = None, project_id: str = "memory") -> None:
+        self.project_id = project_id
+        self.datastore = MemoryDatastore() if datastore is None else datastore
+
+    async def send(self, method: str, body: dict) -> Tuple[dict, int]:
+        return self.datastore.call(method, body), 0
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # The last one counts the values over the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Counters and histograms of the API Calls and of the ODM serialization of a client.
+    Are exported either by a callback receiving every measurement, or by Metrics.prometheus
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float, Dict[str, str]], None]] = None,
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS, prefix: str = "datastore") -> None:
+        """
+        :param callback: receives the name, the value and the labels of every measurement
+        :param buckets: upper bounds of the histogram buckets, in seconds
+        :param prefix: of the names of the metrics
+        """
+        self.callback = callback
+        self.buckets = buckets
+        self.prefix = prefix
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        series = self.counters.setdefault(name, {})
+        key = tuple(labels.items())
+        series[key] = series.get(key, 0) + value
+        if self.callback is not None:
+            self.callback(name, value, labels)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = tuple(labels.items())
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets)
+        histogram.observe(value)
+        if self.callback is not None:
+            self.callback(name, value, labels)
+
+    def rpc(self, method: str, seconds: float, request: dict, sent: int, received: int, response: Optional[dict], status: int) -> None:
+        """
+        Records a single request of an API Call
+        :param request: request body
+        :param sent: bytes of the encoded request body
+        :param received: bytes of the response body
+        :param response: decoded response body, None if the API Call failed
+        """
+        self.observe("rpc_latency_seconds", seconds, method=method)
+        self.count("rpc_requests_total", method=method)
+        self.count("rpc_request_bytes_total", sent, method=method)
+        self.count("rpc_response_bytes_total", received, method=method)
+        if response is None:
+            self.count("rpc_errors_total", method=method, status=str(status))
+            # Outside of a transaction a 409 is an insert of an existing entity
+            if method == "commit" and status == 409 and "transaction" in request:
+                self.count("transaction_conflicts_total")
+            return
+
+        if method == "lookup":
+            self.count("rpc_entities_total", len(response.get("found", ())), method=method)
+            self.count("lookup_missing_total", len(response.get("missing", ())))
+            self.count("lookup_deferred_total", len(response.get("deferred", ())))
+        elif method == "runQuery":
+            self.count("rpc_entities_total", len(response["batch"].get("entityResults", ())), method=method)
+        elif method == "commit":
+            results = response.get("mutationResults", ())
+            self.count("rpc_mutations_total", len(results), method=method)
+            conflicts = sum(1 for result in results if result.get("conflictDetected"))
+            if conflicts:
+                self.count("transaction_conflicts_total" if "transaction" in request else "mutation_conflicts_total", conflicts)
+        elif method == "allocateIds":
+            self.count("rpc_entities_total", len(response.get("keys", ())), method=method)
+
+    def retries(self, method: str, n: int) -> None:
+        self.count("rpc_retries_total", n, method=method)
+
+    def serialization(self, operation: str, seconds: float, n: int) -> None:
+        """
+        Records conversion of entities between the ODM and the wire format
+        :param operation: "encode" or "decode"
+        :param n: number of entities
+        """
+        self.observe("odm_seconds", seconds, operation=operation)
+        self.count("odm_entities_total", n, operation=operation)
+
+    def prometheus(self) -> str:
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, series in self.counters.items():
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_labels(labels)} {value:g}" for labels, value in series.items())
+        for name, series in self.histograms.items():
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels((*labels, ('le', str(bound))))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+
+
+def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = ",".join(f'{name}="{value}"' for name, value in labels)
+    return f"{{{labels}}}" if labels else ""
@@ -9,9 +9,13 @@ if TYPE_CHECKING:
 
 
 class Field(metaclass=ABCMeta):
+    __slots__ = ("_meta", "_index", "_required", "_alter", "_default")
+
     _pyType: Type = None
     _dsType: str = None
     _storeNone: bool = None
+    # Values are mutable and report their mutations to the instance they belong to
+    _container: bool = False
 
     def __init__(self, default: Any = None, required: bool = False, index: bool = False, alter: Optional[Callable[[Any], Any]] = None) -> None:
         self._meta = {}
@@ -26,10 +30,27 @@ class Field(metaclass=ABCMeta):
         if instance is None:
             return self
         value = instance._data.get(self._name)
-        return self._assign(self._default) if value is None else value
+        if value is None:
+            raw = instance._raw
+            if raw is not None and self._name in raw:
+                value = instance._data[self._name] = self._mold(raw.pop(self._name))
+            if value is None:
+                value = self._assign(self._default)
+                if not self._container or value is None:
+                    return value
+                # Otherwise mutations of the default value would be lost
+                instance._data[self._name] = value
+        if self._container:
+            value._parent = instance
+        return value
 
     def __set__(self, instance: Union[Embedded, Kind], value: Any) -> None:
-        instance._data[self._name] = self._mold(value)
+        value = instance._data[self._name] = self._mold(value)
+        if instance._raw is not None:
+            instance._raw.pop(self._name, None)
+        if self._container and value is not None:
+            value._parent = instance
+        instance._touch()
 
     def __eq__(self, other: Field) -> bool:
         return True if (self.__class__ == other.__class__ and
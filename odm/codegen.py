@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import Callable, Dict
+
+from .basefield import Field
+from .fields import IntegerField, StringField, BooleanField, DoubleField
+
+# Fields whose conversion is simple enough to be inlined into the generated code
+_ENCODE_INLINE = {
+    IntegerField: "{{{ds!r}: str(value)}}",
+    StringField: "{{{ds!r}: value}}",
+    BooleanField: "{{{ds!r}: value}}",
+    DoubleField: "{{{ds!r}: value}}",
+}
+_DECODE_INLINE = {
+    IntegerField: "int(value.get({ds!r}))",
+    StringField: "value.get({ds!r})",
+    BooleanField: "value.get({ds!r})",
+    DoubleField: "float(value.get({ds!r}))",
+}
+
+
+def _compile(source: str, name: str, namespace: dict) -> Callable:
+    exec(compile(source, f"<{name}>", "exec"), namespace)
+    return namespace[name]
+
+
+def compile_encoder(fields: Dict[str, Field], skip_none: bool) -> Callable[[dict], dict]:
+    """
+    Generates a function converting the data of an instance into entity properties.
+    Does the same as calling Field._to_entity of each field, without looking the fields up
+    :param skip_none: do not convert None values at all, instead of letting a field store them as "nullValue"
+    """
+    namespace = {}
+    lines = ["def encode(data):", "    properties = {}"]
+    for i, (name, field) in enumerate(fields.items()):
+        namespace[f"to_{i}"] = field._to_entity
+        inline = _ENCODE_INLINE.get(type(field))
+
+        lines.append(f"    value = data.get({name!r})")
+        if inline is not None or skip_none:
+            lines.append("    if value is not None:")
+            if inline is not None:
+                lines.append(f"        properties[{name!r}] = {inline.format(ds=field._dsType)}")
+            else:
+                lines.extend((f"        value = to_{i}(value)",
+                              "        if value is not None:",
+                              f"            properties[{name!r}] = value"))
+            if not skip_none:
+                lines.extend(("    else:",
+                              f"        value = to_{i}(None)",
+                              "        if value is not None:",
+                              f"            properties[{name!r}] = value"))
+        else:
+            lines.extend((f"    value = to_{i}(value)",
+                          "    if value is not None:",
+                          f"        properties[{name!r}] = value"))
+    lines.append("    return properties")
+    return _compile("\n".join(lines), "encode", namespace)
+
+
+def compile_decoder(fields: Dict[str, Field], check_required: bool = True) -> Callable[[dict], dict]:
+    """
+    Generates a function converting entity properties into the data of an instance.
+    Values sourced from Datastore are already typed, so unlike Field.__set__ it skips Field._mold for the regular fields
+    :param check_required: raise ValueError if a required value is missing
+    """
+    namespace = {}
+    lines = ["def decode(properties):", "    data = {}"]
+    for i, (name, field) in enumerate(fields.items()):
+        field_type = type(field)
+        inline = _DECODE_INLINE.get(field_type)
+        trusted = field_type.__set__ is Field.__set__ and field_type._mold is Field._mold
+        namespace[f"from_{i}"] = field._from_entity if trusted else field._mold
+
+        lines.append(f"    value = properties.get({name!r})")
+        if not trusted:
+            if check_required and field._required:
+                lines.extend(("    if value is None:",
+                              "        raise ValueError('Required value is not present or is equal to None')"))
+            lines.append(f"    data[{name!r}] = from_{i}(value)")
+            continue
+
+        lines.append("    if value is not None:")
+        if inline is not None:
+            lines.append(f"        data[{name!r}] = None if 'nullValue' in value else {inline.format(ds=field._dsType)}")
+        else:
+            lines.append(f"        data[{name!r}] = from_{i}(value)")
+        if check_required and field._required:
+            lines.extend(("    else:",
+                          "        raise ValueError('Required value is not present or is equal to None')"))
+    lines.append("    return data")
+    return _compile("\n".join(lines), "decode", namespace)
@@ -5,11 +5,12 @@ from abc import ABCMeta
 from typing import Any, Callable, Optional, Type, Dict, Tuple, Set
 
 from .basefield import Field
+from .codegen import compile_encoder, compile_decoder
 
 
 class EmbeddedMeta(ABCMeta):
     def __new__(mcs, class_name: str, bases: Tuple[type], attrs: dict, **kwargs) -> type:
-        if class_name is not "Embedded":
+        if class_name != "Embedded":
             fields = {}
             noindex = set()
 
@@ -27,21 +28,35 @@ class EmbeddedMeta(ABCMeta):
 
             attrs["_fields"] = fields
             attrs["_noindex"] = noindex
+            # Fields are declared as class attributes, so instances of subclasses need no __dict__
+            attrs.setdefault("__slots__", ())
 
-        return super().__new__(mcs, class_name, bases, attrs, **kwargs)
+        cls = super().__new__(mcs, class_name, bases, attrs, **kwargs)
+        cls._pyType = cls
+        if class_name != "Embedded":
+            cls._encode = staticmethod(compile_encoder(cls._fields, skip_none=True))
+            # An overridden constructor might do more than assigning the values
+            cls._decode = staticmethod(compile_decoder(cls._fields)) if cls.__init__ is Embedded.__init__ else None
+        return cls
 
 
 class Embedded(Field, metaclass=EmbeddedMeta):
+    __slots__ = ("_data", "_parent")
+
     _dsType = "entityValue"
+    _container = True
 
     _fields: Dict[str, Field] = NotImplemented
     _noindex: Set[str] = NotImplemented
+    _encode: Optional[Callable[[dict], dict]] = None
+    _decode: Optional[Callable[[dict], dict]] = None
+    _raw: Optional[Dict[str, dict]] = None
 
     def __init__(self, default: Any = None, required: bool = False, index: bool = False, alter: Optional[Callable[[Any], Any]] = None,
                  **values: Any) -> None:
 
-        self._pyType = self.__class__
         self._data = {}
+        self._parent = None
         for name, field in self._fields.items():
             value = values.get(name)
             if field._required and value is None:
@@ -50,6 +65,10 @@ class Embedded(Field, metaclass=EmbeddedMeta):
 
         super().__init__(default=default, required=required, index=index, alter=alter)
 
+    def _touch(self) -> None:
+        if self._parent is not None:
+            self._parent._touch()
+
     def __eq__(self, other: Embedded) -> bool:
         return True if super().__eq__(other) and self._fields == other._fields else False
 
@@ -80,14 +99,33 @@ class Embedded(Field, metaclass=EmbeddedMeta):
         if value is None:
             return super()._to_entity(value)
 
-        properties = {}
-        for name, field in self._fields.items():
-            property = value._data.get(name)
-            if property is not None:
-                properties[name] = field._to_entity(property)
+        if self._encode is not None:
+            properties = self._encode(value._data)
+        else:
+            properties = {}
+            for name, field in self._fields.items():
+                property = value._data.get(name)
+                if property is not None:
+                    properties[name] = field._to_entity(property)
 
         if properties:
             return {"entityValue": {"properties": properties}}
 
     def _from_entity(self, entity: dict) -> Optional[Embedded]:
-        return None if "nullValue" in entity else self.__class__(**entity["entityValue"]["properties"])
+        if "nullValue" in entity:
+            return None
+        if self._decode is None:
+            return self.__class__(**entity["entityValue"]["properties"])
+
+        # Same state Embedded.__init__ leaves a value with, without molding anything
+        cls = self.__class__
+        value = cls.__new__(cls)
+        value._data = self._decode(entity["entityValue"].get("properties", {}))
+        value._parent = None
+        value._meta = {}
+        value._index = value._required = False
+        value._alter = lambda value: value
+        value._default = None
+        if cls._storeNone is not None:
+            value._update_meta(store_none=cls._storeNone)
+        return value
@@ -8,6 +8,8 @@ from .basefield import Field
 
 
 class IntegerField(Field):
+    __slots__ = ()
+
     _pyType = int
     _dsType = "integerValue"
 
@@ -19,6 +21,8 @@ class IntegerField(Field):
 
 
 class TimestampField(Field):
+    __slots__ = ()
+
     _pyType = int
     _dsType = "timestampValue"
 
@@ -30,6 +34,8 @@ class TimestampField(Field):
 
 
 class StringField(Field):
+    __slots__ = ()
+
     _pyType = str
     _dsType = "stringValue"
 
@@ -41,6 +47,8 @@ class StringField(Field):
 
 
 class BooleanField(Field):
+    __slots__ = ()
+
     _pyType = bool
     _dsType = "booleanValue"
 
@@ -52,6 +60,8 @@ class BooleanField(Field):
 
 
 class DoubleField(Field):
+    __slots__ = ()
+
     _pyType = float
     _dsType = "doubleValue"
 
@@ -63,7 +73,10 @@ class DoubleField(Field):
 
 
 class ArrayField(Field):
+    __slots__ = ("_content",)
+
     _pyType = Array
+    _container = True
     _dsType = "arrayValue"
 
     def __init__(self, content: Field, default: Any = None, required: bool = False, index: bool = False,
@@ -101,10 +114,12 @@ class ArrayField(Field):
         if "nullValue" in entity:
             return None
         values = entity.get(self._dsType).get("values")
-        return self._pyType(self._content, [self._content._from_entity(value) for value in values]) if values else None
+        return self._pyType._from_values(self._content, [self._content._from_entity(value) for value in values]) if values else None
 
 
 class KeyField(Field):
+    __slots__ = ()
+
     _pyType = Key
     _dsType = "keyValue"
 
@@ -112,20 +127,17 @@ class KeyField(Field):
         if value is None:
             return super()._to_entity(value)
 
-        partition = {"projectId": value.project, "namespaceId": value.namespace}
-        path = [{"kind": value.kind, value.id_type: value.id}]
-        return {self._dsType: {"partitionId": partition, "path": path}}
+        return {self._dsType: value._entity}
 
     def _from_entity(self, entity: dict) -> Optional[_pyType]:
         if "nullValue" in entity:
             return None
-        value = entity.get(self._dsType)
-        partition = value.get("partitionId")
-        path = value.get("path")[0]
-        return self._pyType(project=partition.get("projectId"), namespace=partition.get("namespaceId"), id=path.get("id"), name=path.get("name"), kind=path.get("kind"))
+        return self._pyType._from_entity(entity.get(self._dsType))
 
 
 class GeoPointField(Field):
+    __slots__ = ()
+
     _pyType = Location
     _dsType = "geoPointValue"
 
@@ -139,8 +151,8 @@ class GeoPointField(Field):
 
 
 class BlobField(Field):
-    ...
+    __slots__ = ()
 
 
 class LStringField(Field):
-    ...
+    __slots__ = ()
@@ -1,19 +1,28 @@
 from __future__ import annotations
 
 from abc import ABCMeta
+from collections import namedtuple
 from copy import copy
-from typing import Optional, Any, TYPE_CHECKING, Dict, Type, Set, Tuple
+from itertools import product
+from math import prod
+from time import perf_counter
+from typing import Optional, Any, TYPE_CHECKING, Dict, Type, Set, Tuple, AsyncIterator, Callable, Iterable, Iterator, List, Union
 
 from datastore.datatypes import Key
 from .basefield import Field
+from .fields import ArrayField
+from .codegen import compile_encoder, compile_decoder
 
 if TYPE_CHECKING:
     from ..client import Client
 
+# Datastore limits the values of an "IN" filter to 30 as well
+MAX_QUERIES = 30
+
 
 class KindMeta(ABCMeta):
     def __new__(mcs, class_name: str, bases: Tuple[type], attrs: dict, **kwargs: Any) -> Type[Kind]:
-        if class_name is not "Kind":
+        if class_name != "Kind":
             fields = {}
             noindex = set()
 
@@ -37,22 +46,48 @@ class KindMeta(ABCMeta):
             attrs["_fields"] = fields
             attrs["_kind"] = attrs.get("_kind", class_name.lower())
             attrs["_noindex"] = noindex
-        return super().__new__(mcs, class_name, bases, attrs, **kwargs)
+
+        cls = super().__new__(mcs, class_name, bases, attrs, **kwargs)
+        if class_name != "Kind":
+            cls._register()
+            cls._rows = {}
+            cls._encode = staticmethod(compile_encoder(cls._fields, skip_none=False))
+            # An overridden constructor might do more than assigning the values
+            if cls.__init__ is Kind.__init__:
+                cls._decode = staticmethod(compile_decoder(cls._fields))
+                cls._decode_trusted = staticmethod(compile_decoder(cls._fields, check_required=False))
+            else:
+                cls._decode = cls._decode_trusted = None
+        return cls
 
 
 class Kind(metaclass=KindMeta):
     _kind: str = None
     _storeNone: bool = None
+    _lazy: bool = False
+    # Whether mutations are conditioned on the version the entity was read at, see Client.save_merged
+    _optimistic: bool = False
+    # Whether save, update and delete go through the write-behind buffer of the client instead of committing at once
+    _write_behind: bool = False
+    # Whether the entity changed since it was received from or committed to Datastore
+    _dirty: bool = True
 
     ds: Client = NotImplemented
     key: Key = NotImplemented
+    _kinds: Dict[str, Type[Kind]] = {}
+    _rows: Dict[Tuple[str, ...], Type[tuple]] = NotImplemented
     _fields: Dict[str, Field] = NotImplemented
     _noindex: Set[str] = NotImplemented
-    _v: Optional[str] = NotImplemented
-    _backup_v: Optional[str] = NotImplemented
-    _backup_key: Optional[Key] = NotImplemented
+    _encode: Optional[Callable[[dict], dict]] = None
+    _decode: Optional[Callable[[dict], dict]] = None
+    _decode_trusted: Optional[Callable[[dict], dict]] = None
+    # Not yet decoded properties of a lazily hydrated entity
+    _raw: Optional[Dict[str, dict]] = None
+    _v: Optional[str] = None
+    _backup_v: Optional[str] = None
+    _backup_key: Optional[Key] = None
 
-    def __init__(self, client: Client, namespace: str = None, id: Optional[int] = None, name: Optional[str] = None, prealocate: bool = False,
+    def __init__(self, client: Optional[Client] = None, namespace: str = None, id: Optional[int] = None, name: Optional[str] = None, prealocate: bool = False,
                  reserve: bool = False, **values: Any) -> None:
 
         if bool(id is not None) + bool(name is not None) + prealocate + reserve > 1:
@@ -60,11 +95,13 @@ class Kind(metaclass=KindMeta):
 
         self._data = {}
         self._v = self._backup_v = self._backup_key = None
-        self.ds = client
+        if client is not None:
+            self.ds = client
 
         self.key = Key(project=self.ds.project_id, kind=self._kind, namespace=namespace, id=id, name=name)
         if prealocate:
-            self.preallocate()
+            # Taken from the pool of the client, so that the construction does not wait for an API Call
+            self.key._complete(id=self.ds.ids.take(self._kind, namespace))
         elif reserve:
             self.reserve()
 
@@ -74,6 +111,24 @@ class Kind(metaclass=KindMeta):
                 raise ValueError("Required value is not present or is equal to None")
             setattr(self, name, value)
 
+    @classmethod
+    def _register(cls) -> None:
+        """
+        Registers the class as the one entities of its kind are constructed as when no class is requested,
+        e.g. by Client.lookup_multiple of keys. A subclass sharing the kind of its base leaves the base registered
+        :raise TypeError: if an unrelated class is registered for the kind
+        """
+        registered = cls._kinds.get(cls._kind)
+        # A class defined anew, e.g. by a reloaded module, replaces its previous definition
+        if (registered is None or
+                (registered.__module__, registered.__qualname__) == (cls.__module__, cls.__qualname__)):
+            cls._kinds[cls._kind] = cls
+        elif not issubclass(cls, registered):
+            raise TypeError(f"Kind \"{cls._kind}\" is already registered by {registered.__module__}.{registered.__qualname__}")
+
+    def _touch(self) -> None:
+        self._dirty = True
+
     def _backup(self) -> None:
         self._v = self._backup_v
         self.key._backup()
@@ -88,70 +143,436 @@ class Kind(metaclass=KindMeta):
         self.key._clear_backup()
 
     def _to_entity(self) -> dict:
-        values = {}
-        for name, field in self._fields.items():
-            value = field._to_entity(self._data.get(name))
-            if value is not None:
-                values[name] = value
-        if values:
-            return {"key": self.key._entity, "properties": values}
+        if self._encode is not None:
+            values = self._encode(self._data)
+        else:
+            values = {}
+            for name, field in self._fields.items():
+                value = field._to_entity(self._data.get(name))
+                if value is not None:
+                    values[name] = value
+
+        # Properties of a lazily hydrated entity that were never accessed are passed through as they were received
+        if self._raw:
+            values.update(self._raw)
+        return {"key": self.key._entity, "properties": values}
 
     @classmethod
-    def _from_entity(cls, entity: dict) -> Kind:
+    def _from_entity(cls, entity: dict, client: Optional[Client] = None) -> Kind:
+        version = entity.get("version")
         entity = entity.get("entity")
         key = Key._from_entity(entity.get("key"))
-        return cls(**{"namespace": key.namespace, key.id_type: key.id}, **entity.get("properties"))
+        if cls is Kind:
+            cls = cls._kinds[key.kind]
+        if cls._decode is None:
+            instance = cls(client, **{"namespace": key.namespace, key.id_type: key.id}, **entity.get("properties", {}))
+            instance._dirty = False
+            instance._v = version
+            return instance
+
+        return cls._hydrate(key, entity.get("properties", {}), client, cls._decode, version)
+
+    @classmethod
+    def _from_entities(cls, entities: Iterable[dict], client: Optional[Client] = None) -> Iterator[Kind]:
+        """
+        Bulk constructor of entities received from Datastore.
+        Unlike Kind._from_entity the values are trusted: required values are not checked
+        :param entities: entity results
+        """
+        for entity in entities:
+            version = entity.get("version")
+            entity = entity["entity"]
+            key = Key._from_entity(entity["key"])
+            kind = cls._kinds[key.kind] if cls is Kind else cls
+            if kind._decode_trusted is None:
+                instance = kind(client, **{"namespace": key.namespace, key.id_type: key.id}, **entity.get("properties", {}))
+                instance._dirty = False
+                instance._v = version
+                yield instance
+            else:
+                yield kind._hydrate(key, entity.get("properties", {}), client, kind._decode_trusted, version)
+
+    @classmethod
+    def _hydrate(cls, key: Key, properties: dict, client: Optional[Client], decode: Callable[[dict], dict],
+                 version: Optional[str] = None) -> Kind:
+        instance = cls.__new__(cls)
+        if cls._lazy:
+            instance._data = {}
+            instance._raw = {name: value for name, value in properties.items() if name in cls._fields}
+        else:
+            instance._data = decode(properties)
+        if client is not None:
+            instance.ds = client
+        instance.key = key
+        instance._dirty = False
+        instance._v = version
+        return instance
+
+    def _refresh(self, stored: Kind) -> None:
+        """
+        Replaces the values and the version with the ones of the stored state of the entity
+        """
+        self._data = stored._data
+        self._raw = stored._raw
+        self._v = stored._v
+        self._dirty = False
+
+    @classmethod
+    def _query(cls, _quantity: Optional[int] = None, **filters: Any) -> dict:
+        queries, _ = cls._queries(_quantity, **filters)
+        if len(queries) != 1:
+            raise ValueError("Multi-value filters are supported only by find_where")
+        return queries[0]
+
+    @classmethod
+    def _queries(cls, _quantity: Optional[int] = None, _order: Iterable[str] = (), _or: Iterable[Dict[str, Any]] = (),
+                 **filters: Any) -> Tuple[List[dict], Tuple[Tuple[str, bool], ...]]:
+        """
+        Expands the multi-value filters ("name__in", "name__ne" and the alternatives of "_or") into queries
+        of equality and range filters, one for every combination of the values
+        :raise ValueError: if the filters expand into more than MAX_QUERIES queries
+        :param _order: names of the fields to sort by, prefixed with "-" to sort descending
+        :return: queries and their order, the names of the properties and whether they are sorted descending
+        """
+        # Alternatives of every filter, each one is a tuple of property filters
+        alternatives = [cls._alternatives(name, value) for name, value in filters.items()]
+        _or = tuple(_or)
+        if _or:
+            alternatives.append([tuple(condition for alternative in combination for condition in alternative)
+                                 for alternative_filters in _or
+                                 for combination in product(*(cls._alternatives(name, value)
+                                                              for name, value in alternative_filters.items()))])
+
+        n_queries = prod(map(len, alternatives))
+        if n_queries > MAX_QUERIES:
+            raise ValueError(f"Filters expand into {n_queries} queries, at most {MAX_QUERIES} are supported")
+
+        order = tuple((name[1:], True) if name.startswith("-") else (name, False) for name in _order)
+        inequalities = {condition["property"]["name"] for conditions in alternatives for alternative in conditions
+                        for condition in alternative if condition["op"] != "EQUAL"}
+        if len(inequalities) > 1:
+            raise ValueError("\"__ne\" filters are supported on a single field")
+        if inequalities:
+            # Datastore sorts by the property of the inequality filter first
+            name, = inequalities
+            if not order:
+                order = ((name, False),)
+            elif order[0][0] != name:
+                raise ValueError(f"Results of a \"__ne\" filter should be sorted by \"{name}\" first")
+
+        queries = []
+        for combination in product(*alternatives):
+            conditions = [{"propertyFilter": condition} for alternative in combination for condition in alternative]
+            query = {"kind": [{"name": cls._kind}]}
+            if len(conditions) == 1:
+                query["filter"] = conditions[0]
+            elif conditions:
+                query["filter"] = {"compositeFilter": {"op": "AND", "filters": conditions}}
+            if order:
+                query["order"] = [{"property": {"name": name}, "direction": "DESCENDING" if descending else "ASCENDING"}
+                                  for name, descending in order]
+            if _quantity is not None:
+                query["limit"] = _quantity
+            queries.append(query)
+        return queries, order
+
+    @classmethod
+    def _alternatives(cls, name: str, value: Any) -> List[Tuple[dict, ...]]:
+        """
+        :param name: name of the field, optionally suffixed with "__in" or "__ne"
+        :return: alternative property filters of a filter
+        """
+        name, _, lookup = name.partition("__")
+        if lookup == "in":
+            return [({"property": {"name": name}, "op": "EQUAL", "value": cls._filter_value(name, item)},) for item in value]
+        if lookup == "ne":
+            value = cls._filter_value(name, value)
+            return [({"property": {"name": name}, "op": op, "value": value},) for op in ("LESS_THAN", "GREATER_THAN")]
+        if lookup:
+            raise ValueError(f"Unknown filter \"{lookup}\", expected \"in\" or \"ne\"")
+        return [({"property": {"name": name}, "op": "EQUAL", "value": cls._filter_value(name, value)},)]
 
-    async def fetch(self):
+    @classmethod
+    def _filter_value(cls, name: str, value: Any) -> dict:
+        field = cls._fields.get(name)
+        if field is None:
+            raise ValueError(f"{cls.__name__} has no field \"{name}\"")
+        # Arrays are indexed by their elements, which are what is filtered by
+        if isinstance(field, ArrayField):
+            field = field._content
+        value = field._to_entity(field._mold(value))
+        return {"nullValue": None} if value is None else value
+
+    @classmethod
+    async def find_where(cls, _namespace: Optional[str] = None, _quantity: Optional[int] = None, _prefetch: Optional[int] = None,
+                         _eventual: bool = False, _order: Iterable[str] = (), _or: Iterable[Dict[str, Any]] = (),
+                         **filters: Any) -> AsyncIterator[Kind]:
+        """
+        Uses "runQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runQuery
+        Entities are yielded as pages arrive, so memory usage does not depend on the size of the result.
+        Multi-value filters are expanded into several queries, which are run concurrently and merged with Client.query_merged
+        :param _namespace:
+        :param _quantity: max number of entities to find
+        :param _prefetch: max number of pages requested ahead. Defaults to Client.query_prefetch
+        :param _eventual: use eventual consistency
+        :param _order: names of the fields to sort by, prefixed with "-" to sort descending
+        :param _or: alternative sets of filters, at least one of which has to match
+        :param filters: field values to be equal to. Suffixed with "__in" to be equal to any of the values,
+        with "__ne" to be not equal to the value
+        :return:
+        """
+        queries, order = cls._queries(_quantity, _order, _or, **filters)
+        requests = [cls._request(_namespace, query, _eventual) for query in queries]
+        if len(requests) == 1:
+            pages = cls.ds.query_pages(requests[0], prefetch=_prefetch)
+        else:
+            pages = cls.ds.query_merged(requests, order, _quantity, prefetch=_prefetch)
+
+        metrics = cls.ds.metrics
+        async for page in pages:
+            if metrics is None:
+                for entity in cls._from_entities(page):
+                    yield entity
+                continue
+
+            started = perf_counter()
+            entities = tuple(cls._from_entities(page))
+            metrics.serialization("decode", perf_counter() - started, len(entities))
+            for entity in entities:
+                yield entity
+
+    @classmethod
+    async def find_keys_where(cls, _namespace: Optional[str] = None, _quantity: Optional[int] = None, _prefetch: Optional[int] = None,
+                              _eventual: bool = False, **filters: Any) -> AsyncIterator[Key]:
+        """
+        Uses "runQuery" API Call with keys-only projection
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runQuery
+        Only keys are read, which is cheaper than reading whole entities
+        :param _namespace:
+        :param _quantity: max number of keys to find
+        :param _prefetch: max number of pages requested ahead. Defaults to Client.query_prefetch
+        :param _eventual: use eventual consistency
+        :param filters: field values to be equal to
+        :return:
+        """
+        query = cls._query(_quantity=_quantity, **filters)
+        query["projection"] = [{"property": {"name": "__key__"}}]
+        async for page in cls.ds.query_pages(cls._request(_namespace, query, _eventual), prefetch=_prefetch):
+            for entity in page:
+                yield Key._from_entity(entity["entity"]["key"])
+
+    @classmethod
+    async def project_where(cls, *_properties: str, _namespace: Optional[str] = None, _quantity: Optional[int] = None,
+                            _prefetch: Optional[int] = None, _eventual: bool = False, **filters: Any) -> AsyncIterator[tuple]:
+        """
+        Uses "runQuery" API Call with projection
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runQuery
+        Rows are read-only named tuples of the key and the requested properties.
+        An entity has a row for every element of a projected array field
+        :param _properties: names of indexed fields to read
+        :param _namespace:
+        :param _quantity: max number of rows to find
+        :param _prefetch: max number of pages requested ahead. Defaults to Client.query_prefetch
+        :param _eventual: use eventual consistency
+        :param filters: field values to be equal to
+        :return:
+        """
+        row = cls._projection(_properties)
+        # Elements of an array are projected one by one
+        fields = tuple(field._content if isinstance(field, ArrayField) else field
+                       for field in (cls._fields[name] for name in _properties))
+
+        query = cls._query(_quantity=_quantity, **filters)
+        query["projection"] = [{"property": {"name": name}} for name in _properties]
+        async for page in cls.ds.query_pages(cls._request(_namespace, query, _eventual), prefetch=_prefetch):
+            for entity in page:
+                entity = entity["entity"]
+                properties = entity.get("properties", {})
+                yield row(Key._from_entity(entity["key"]),
+                          *(None if value is None else field._from_entity(value)
+                            for field, value in zip(fields, (properties.get(name) for name in _properties))))
+
+    @classmethod
+    def _projection(cls, properties: Tuple[str, ...]) -> Type[tuple]:
+        row = cls._rows.get(properties)
+        if row is None:
+            if not properties:
+                raise ValueError("At least one property should be projected")
+            for name in properties:
+                field = cls._fields.get(name)
+                if field is None:
+                    raise ValueError(f"{cls.__name__} has no field \"{name}\"")
+                if not field._index:
+                    raise ValueError(f"Only indexed fields can be projected, \"{name}\" is not indexed")
+            row = cls._rows[properties] = namedtuple(f"{cls.__name__}Row", ("key", *properties))
+        return row
+
+    @classmethod
+    async def count_where(cls, _namespace: Optional[str] = None, _eventual: bool = False, _up_to: Optional[int] = None,
+                          **filters: Any) -> int:
+        """
+        Uses "runAggregationQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runAggregationQuery
+        Entities are counted by Datastore, without being read
+        :param _namespace:
+        :param _eventual: use eventual consistency
+        :param _up_to: max number of entities to count, counting stops once it is reached
+        :param filters: field values to be equal to
+        :return: number of entities
+        """
+        count = {} if _up_to is None else {"upTo": str(_up_to)}
+        return (await cls._aggregate([{"alias": "count", "count": count}], _namespace, _eventual, filters))["count"]
+
+    @classmethod
+    async def sum_where(cls, _field: str, _namespace: Optional[str] = None, _eventual: bool = False,
+                        **filters: Any) -> Union[int, float]:
+        """
+        Uses "runAggregationQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runAggregationQuery
+        :param _field: name of the field to sum up, values other than numbers are skipped
+        :param _namespace:
+        :param _eventual: use eventual consistency
+        :param filters: field values to be equal to
+        :return: integer if all the values are integers
+        """
+        return (await cls.aggregate_where(f"sum__{_field}", _namespace=_namespace, _eventual=_eventual, **filters))[f"sum__{_field}"]
+
+    @classmethod
+    async def avg_where(cls, _field: str, _namespace: Optional[str] = None, _eventual: bool = False,
+                        **filters: Any) -> Optional[float]:
+        """
+        Uses "runAggregationQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runAggregationQuery
+        :param _field: name of the field to average, values other than numbers are skipped
+        :param _namespace:
+        :param _eventual: use eventual consistency
+        :param filters: field values to be equal to
+        :return: None if there are no numbers to average
+        """
+        return (await cls.aggregate_where(f"avg__{_field}", _namespace=_namespace, _eventual=_eventual, **filters))[f"avg__{_field}"]
+
+    @classmethod
+    async def aggregate_where(cls, *_aggregations: str, _namespace: Optional[str] = None, _eventual: bool = False,
+                              **filters: Any) -> Dict[str, Union[int, float, None]]:
+        """
+        Uses "runAggregationQuery" API Call
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/runAggregationQuery
+        Several aggregations of the same entities are computed together, see Client.run_aggregation
+        :param _aggregations: "count", "sum__<field>" or "avg__<field>"
+        :param _namespace:
+        :param _eventual: use eventual consistency
+        :param filters: field values to be equal to
+        :return: values by the aggregations
+        """
+        aggregations = []
+        for alias in dict.fromkeys(_aggregations):
+            operator, _, name = alias.partition("__")
+            if operator == "count" and not name:
+                aggregations.append({"alias": alias, "count": {}})
+            elif operator in ("sum", "avg") and name in cls._fields:
+                aggregations.append({"alias": alias, operator: {"property": {"name": name}}})
+            else:
+                raise ValueError(f"Unknown aggregation \"{alias}\", expected \"count\", \"sum__<field>\" or \"avg__<field>\"")
+        return await cls._aggregate(aggregations, _namespace, _eventual, filters)
+
+    @classmethod
+    async def _aggregate(cls, aggregations: List[dict], namespace: Optional[str], eventual: bool,
+                         filters: Dict[str, Any]) -> Dict[str, Union[int, float, None]]:
+        if not aggregations:
+            raise ValueError("At least one aggregation should be requested")
+        data = cls._request(namespace, cls._query(**filters), eventual)
+        data["aggregationQuery"] = {"nestedQuery": data.pop("query"), "aggregations": aggregations}
+        return await cls.ds.run_aggregation(data)
+
+    @classmethod
+    def _request(cls, namespace: Optional[str], query: dict, eventual: bool = False) -> dict:
+        if cls.ds is NotImplemented:
+            raise TypeError(f"{cls.__name__} is not bound to a Client")
+        data = {"partitionId": {"projectId": cls.ds.project_id, "namespaceId": namespace}, "query": query}
+        if eventual:
+            data["readOptions"] = {"readConsistency": "EVENTUAL"}
+        return data
+
+    async def fetch(self, eventual: bool = False) -> Optional[Kind]:
         """
         Uses "lookup" API Call
         https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/lookup
-        :return:
+        :param eventual: use eventual consistency
+        :return: stored state of the entity, None if it does not exist
         """
-        return self.lookup(key=self.key)
+        return await self.ds.lookup(self.key, eventual=eventual, kind=type(self))
 
-    async def update(self):
+    async def update(self) -> bool:
         """
         Uses "commit" API Call with mutation/operation "update"
         https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/commit#Mutation
-        :return:
+        :return: False if a conflict was detected. Always True for a Kind with _write_behind
         """
-        pass
+        if self._write_behind:
+            await self.ds.buffer.update(self)
+            return True
+        return not await self.ds._execute(update=(self,))
 
-    async def save(self):
+    async def save(self) -> bool:
         """
         Uses "commit" API Call with mutation/operation "upsert"
         https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/commit#Mutation
-        :return:
+        :return: False if a conflict was detected. Always True for a Kind with _write_behind
         """
-        pass
+        if self._write_behind:
+            await self.ds.buffer.save(self)
+            return True
+        return not await self.ds._execute(save=(self,))
+
+    async def save_merged(self, merge: Callable[[Kind], Any], retries: Optional[int] = None) -> bool:
+        """
+        Uses "commit" API Call with mutation/operation "upsert" conditioned on the version the entity was read at
+        https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/commit#Mutation
+        See Client.save_merged
+        :param merge: applies the changes to the entity, is applied again to its stored state on a conflict
+        :param retries: defaults to client.MERGE_RETRIES
+        :return: False if the entity was still conflicting after the retries or was deleted
+        """
+        if retries is None:
+            return not await self.ds.save_merged(self, merge=merge)
+        return not await self.ds.save_merged(self, merge=merge, retries=retries)
 
-    async def insert(self):
+    async def insert(self) -> bool:
         """
         Uses "commit" API Call with mutation/operation "insert"
         https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/commit#Mutation
-        :return:
+        :return: False if a conflict was detected
         """
-        pass
+        return not await self.ds._execute(insert=(self,))
 
-    async def lookup(self, id: Optional[int] = None, name: Optional[str] = None, key: Optional[Key] = None):
+    @classmethod
+    async def lookup(cls, id: Optional[int] = None, name: Optional[str] = None, key: Optional[Key] = None,
+                     namespace: Optional[str] = None, eventual: bool = False) -> Optional[Kind]:
         """
         Uses "lookup" API Call
         https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/lookup
         :param id:
         :param name:
-        :param key:
-        :return:
+        :param key: used instead of id/name
+        :param namespace:
+        :param eventual: use eventual consistency
+        :return: found entity, None if it does not exist
         """
-        return self.ds.lookup(key=key)
+        if key is None:
+            key = Key(project=cls.ds.project_id, kind=cls._kind, namespace=namespace, id=id, name=name)
+        return await cls.ds.lookup(key, eventual=eventual, kind=cls)
 
-    async def delete(self):
+    async def delete(self) -> bool:
         """
         Uses "commit" API Call with mutation/operation "delete"
         https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/commit#Mutation
-        :return:
+        :return: False if a conflict was detected. Always True for a Kind with _write_behind
         """
-        pass
+        if self._write_behind:
+            await self.ds.buffer.delete(self)
+            return True
+        return not await self.ds._execute(delete=(self,))
 
     async def reserve(self):
         """
@@ -161,10 +582,12 @@ class Kind(metaclass=KindMeta):
         """
         pass
 
-    async def preallocate(self):
+    async def preallocate(self) -> Key:
         """
-        Uses "allocateIds" API Call
+        Completes the key with an ID from the pool of the client, waits for "allocateIds" API Call if the pool is empty
         https://cloud.google.com/datastore/docs/reference/data/rest/v1/projects/allocateIds
-        :return:
+        :return: completed key
         """
-        pass
+        if self.key.id_type is None:
+            self.key._complete(id=await self.ds.ids.get(self._kind, self.key.namespace))
+        return self.key
@@ -0,0 +1,58 @@
+"""
+Order of the values in Datastore
+https://cloud.google.com/datastore/docs/concepts/entities#value_type_ordering
+"""
+from __future__ import annotations
+
+from base64 import b64decode
+from typing import List, Optional
+
+NULL, INTEGER, TIMESTAMP, BOOLEAN, BYTES, DOUBLE, GEO_POINT, KEY = range(8)
+
+
+def key_order(key: dict) -> tuple:
+    """
+    Identity of a complete key, sortable in the order of Datastore
+    """
+    return (key.get("partitionId", {}).get("namespaceId") or "",
+            *((element["kind"], 0, int(element["id"])) if "id" in element else (element["kind"], 1, element["name"])
+              for element in key["path"]))
+
+
+def value_order(value: dict) -> Optional[tuple]:
+    """
+    :return: position of an indexable value in the order of Datastore, None if it is not indexable
+    """
+    if value.get("excludeFromIndexes"):
+        return None
+    if "nullValue" in value:
+        return NULL, 0
+    if "integerValue" in value:
+        return INTEGER, int(value["integerValue"])
+    if "timestampValue" in value:
+        return TIMESTAMP, value["timestampValue"]
+    if "booleanValue" in value:
+        return BOOLEAN, value["booleanValue"]
+    if "stringValue" in value:
+        return BYTES, value["stringValue"].encode()
+    if "blobValue" in value:
+        return BYTES, b64decode(value["blobValue"])
+    if "doubleValue" in value:
+        return DOUBLE, float(value["doubleValue"])
+    if "geoPointValue" in value:
+        return GEO_POINT, (value["geoPointValue"].get("latitude", 0), value["geoPointValue"].get("longitude", 0))
+    if "keyValue" in value:
+        return KEY, key_order(value["keyValue"])
+    return None
+
+
+def value_orders(value: Optional[dict]) -> List[tuple]:
+    """
+    :return: positions of the indexed values of a property, an array is indexed by its elements
+    """
+    if value is None:
+        return []
+    if "arrayValue" in value:
+        return [order for order in map(value_order, value["arrayValue"].get("values", ())) if order is not None]
+    order = value_order(value)
+    return [] if order is None else [order]
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+import asyncio
+
+from .errors import IdPoolExhausted
+
+
+class IdPool:
+    """
+    Numeric IDs allocated ahead of time, per kind and namespace.
+    Once a pool drops to the low-water mark it is refilled in the background, so that an ID can be taken synchronously
+    """
+
+    def __init__(self, allocate: Callable[[str, Optional[str], int], Awaitable[Iterable[int]]], size: int = 1000,
+                 low_water: int = 250) -> None:
+        """
+        :param allocate: allocates the given number of IDs of a kind in a namespace
+        :param size: number of IDs allocated with each refill
+        :param low_water: number of IDs left in a pool that triggers a refill
+        """
+        self.size = size
+        self.low_water = low_water
+        self.__allocate = allocate
+        self.__ids: Dict[Tuple[str, Optional[str]], Deque[int]] = {}
+        self.__refills: Dict[Tuple[str, Optional[str]], asyncio.Task] = {}
+        self.__errors: Dict[Tuple[str, Optional[str]], BaseException] = {}
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self.__ids.values())
+
+    def available(self, kind: str, namespace: Optional[str] = None) -> int:
+        ids = self.__ids.get((kind, namespace))
+        return 0 if ids is None else len(ids)
+
+    def take(self, kind: str, namespace: Optional[str] = None) -> int:
+        """
+        Takes an ID without waiting. Starts a refill if the pool is low, provided an event loop is running
+        :raise IdPoolExhausted: if the pool is empty
+        """
+        pool = (kind, namespace)
+        ids = self.__ids.get(pool)
+        if ids is None:
+            ids = self.__ids[pool] = deque()
+        if len(ids) <= self.low_water:
+            self.__refill(pool)
+        try:
+            return ids.popleft()
+        except IndexError:
+            raise IdPoolExhausted(kind, namespace, f"No preallocated IDs of kind {kind!r} are left, the pool should be filled first, see IdPool.fill") from self.__errors.get(pool)
+
+    async def get(self, kind: str, namespace: Optional[str] = None) -> int:
+        """
+        Takes an ID, waits for a refill if the pool is empty
+        :raise RequestFailed: if the refill failed
+        """
+        pool = (kind, namespace)
+        while True:
+            try:
+                return self.take(kind, namespace)
+            except IdPoolExhausted:
+                await self.__refills[pool]
+
+    async def fill(self, kind: str, namespace: Optional[str] = None, n: Optional[int] = None) -> None:
+        """
+        Waits until the pool holds at least n IDs. Allows a burst of entity construction right from the start
+        :param n: defaults to IdPool.size
+        """
+        pool = (kind, namespace)
+        n = self.size if n is None else n
+        ids = self.__ids.setdefault(pool, deque())
+        while len(ids) < n:
+            self.__refill(pool)
+            await self.__refills[pool]
+
+    def close(self) -> None:
+        """
+        Cancels the refills in progress. IDs left in the pools stay usable
+        """
+        for task in self.__refills.values():
+            task.cancel()
+        self.__refills.clear()
+
+    def __refill(self, pool: Tuple[str, Optional[str]]) -> None:
+        task = self.__refills.get(pool)
+        if task is not None and not task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = self.__refills[pool] = loop.create_task(self.__run_refill(pool))
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def __run_refill(self, pool: Tuple[str, Optional[str]]) -> None:
+        try:
+            ids = await self.__allocate(*pool, self.size)
+        except Exception as error:
+            self.__errors[pool] = error
+            raise
+        self.__errors.pop(pool, None)
+        self.__ids[pool].extend(ids)
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from collections import deque
+from random import random
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Type, Tuple
+import asyncio
+
+from aiohttp import ClientConnectionError
+
+from .errors import RequestFailed
+
+# ABORTED, RESOURCE_EXHAUSTED, INTERNAL, UNAVAILABLE and DEADLINE_EXCEEDED, with the gateway errors in front of them
+RETRY_STATUSES = frozenset((409, 429, 500, 502, 503, 504))
+RETRY_ERRORS = (ClientConnectionError, asyncio.TimeoutError)
+
+
+class RetryPolicy:
+    """
+    Retries of an API Call with an exponential backoff and a jitter, within a deadline.
+    Optionally hedges: sends a second request if the first one is slower than the given percentile of the recent ones
+    """
+
+    def __init__(self, attempts: Optional[int] = 5, backoff: float = 0.1, max_backoff: float = 5, multiplier: float = 2,
+                 jitter: float = 1, deadline: Optional[float] = 30, statuses: FrozenSet[int] = RETRY_STATUSES,
+                 errors: Tuple[Type[BaseException], ...] = RETRY_ERRORS, hedge_percentile: Optional[float] = None,
+                 hedge_min_samples: int = 50, hedge_window: int = 1000) -> None:
+        """
+        :param attempts: max number of attempts including the first one. None to retry until the deadline
+        :param backoff: delay before the first retry
+        :param max_backoff: max delay between retries
+        :param multiplier: the delay is multiplied by with every retry
+        :param jitter: fraction of the delay which is randomized. 1 for the "full jitter"
+        :param deadline: seconds all the attempts and the delays between them have to fit in
+        :param statuses: response statuses of the failures that are retried
+        :param errors: exceptions that are retried
+        :param hedge_percentile: percentile of the latency, after which a hedging request is sent. None to not hedge
+        :param hedge_min_samples: number of measured latencies required to hedge
+        :param hedge_window: number of the recent latencies the percentile is calculated of
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.statuses = statuses
+        self.errors = errors
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.__latencies = deque(maxlen=hedge_window)
+        self.__hedge_after = None
+        self.__samples_since = 0
+
+    def retryable(self, error: BaseException) -> bool:
+        if isinstance(error, RequestFailed):
+            return error.status in self.statuses
+        return isinstance(error, self.errors)
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: number of the failed attempt, starting with 1
+        """
+        delay = min(self.backoff * self.multiplier ** (attempt - 1), self.max_backoff)
+        return delay * (1 - self.jitter * random())
+
+    def exhausted(self, attempt: int, started: float, delay: float) -> bool:
+        """
+        :param attempt: number of the failed attempt, starting with 1
+        :param started: time.monotonic() of the first attempt
+        :param delay: delay before the next attempt
+        """
+        return ((self.attempts is not None and attempt >= self.attempts) or
+                (self.deadline is not None and monotonic() - started + delay >= self.deadline))
+
+    async def call(self, request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        :param request: sends the API Call, is called for every attempt
+        :return: result of the first successful attempt
+        """
+        started = monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if self.deadline is None:
+                    return await self.__attempt(request)
+                return await asyncio.wait_for(self.__attempt(request), self.deadline - (monotonic() - started))
+            except Exception as error:
+                if not self.retryable(error):
+                    raise
+                delay = self.delay(attempt)
+                if self.exhausted(attempt, started, delay):
+                    raise
+            await asyncio.sleep(delay)
+
+    async def __attempt(self, request: Callable[[], Awaitable[Any]]) -> Any:
+        hedge_after = self.__hedge_after if self.hedge_percentile is not None else None
+        started = monotonic()
+        if hedge_after is None:
+            result = await request()
+            self.__measure(monotonic() - started)
+            return result
+
+        first = asyncio.ensure_future(request())
+        try:
+            done, _ = await asyncio.wait((first,), timeout=hedge_after)
+            if done:
+                result = first.result()
+                self.__measure(monotonic() - started)
+                return result
+
+            second = asyncio.ensure_future(request())
+            pending = {first, second}
+            error = None
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            # The slow first request is measured as well, so that the percentile follows the brownouts
+                            self.__measure(monotonic() - started)
+                            return task.result()
+                        error = error or task.exception()
+                raise error
+            finally:
+                second.cancel()
+        finally:
+            first.cancel()
+
+    def __measure(self, latency: float) -> None:
+        if self.hedge_percentile is None:
+            return
+        self.__latencies.append(latency)
+        self.__samples_since += 1
+        # The percentile is recalculated periodically rather than with every request
+        if len(self.__latencies) >= self.hedge_min_samples and (self.__hedge_after is None or
+                                                                 self.__samples_since >= self.hedge_min_samples):
+            latencies = sorted(self.__latencies)
+            self.__hedge_after = latencies[min(int(len(latencies) * self.hedge_percentile / 100), len(latencies) - 1)]
+            self.__samples_since = 0
+
+
+def default_retry() -> Dict[str, RetryPolicy]:
+    """
+    :return: policies by the method of the API Call, and of the "transaction" decorator
+    """
+    return {"lookup": RetryPolicy(),
+            "runQuery": RetryPolicy(),
+            "runAggregationQuery": RetryPolicy(),
+            # Used only for the mutations that can be applied twice, see Client._execute
+            "commit": RetryPolicy(),
+            "allocateIds": RetryPolicy(),
+            "reserveIds": RetryPolicy(),
+            "beginTransaction": RetryPolicy(),
+            "rollback": RetryPolicy(),
+            "transaction": RetryPolicy(attempts=None, backoff=0.05, max_backoff=2, deadline=60)}
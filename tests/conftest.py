@@ -0,0 +1,38 @@
+"""
+The repository is the "datastore" package. Run from its root with: pytest tests
+"""
+from __future__ import annotations
+
+from typing import Callable, List, Tuple
+import os
+import sys
+import types
+
+import pytest
+
+if "datastore" not in sys.modules:
+    package = types.ModuleType("datastore")
+    package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    sys.modules["datastore"] = package
+
+from datastore.client import Client
+from datastore.memory import MemoryDatastore, MemoryTransport
+
+
+@pytest.fixture
+def client() -> Callable[..., Tuple[Client, List[str], MemoryDatastore]]:
+    """
+    :return: factory of clients over a MemoryDatastore, which also returns the methods of the API Calls it received
+    """
+    def create(**kwargs) -> Tuple[Client, List[str], MemoryDatastore]:
+        datastore = MemoryDatastore(**kwargs.pop("datastore", {}))
+        calls = []
+        call = datastore.call
+
+        def record(method: str, body: dict) -> dict:
+            calls.append(method)
+            return call(method, body)
+
+        datastore.call = record
+        return Client(project_id="test", transport=MemoryTransport(datastore), **kwargs), calls, datastore
+    return create
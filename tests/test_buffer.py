@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from datastore.errors import RequestFailed
+from datastore.memory import MemoryTransport
+from datastore.odm import Kind, IntegerField
+from datastore.retry import RetryPolicy
+
+
+class Draft(Kind):
+    n = IntegerField()
+
+
+class FailingTransport(MemoryTransport):
+    """
+    Fails the next API Calls of a method before they are applied
+    """
+
+    def __init__(self, datastore) -> None:
+        super().__init__(datastore)
+        self.failures = {}
+
+    async def send(self, method: str, body: dict):
+        if self.failures.get(method):
+            self.failures[method] -= 1
+            raise RequestFailed(503, "Service unavailable")
+        return await super().send(method, body)
+
+
+def test_write_buffer_coalesces_per_key(client):
+    async def run():
+        ds, calls, datastore = client(buffer_interval=60)
+        Draft.ds = ds
+        await ds.connect()
+        draft = Draft(id=1, n=0)
+        for i in range(100):
+            draft.n = i
+            await ds.buffer.save(draft)
+        await ds.buffer.delete(Draft(id=2))
+        assert calls == [] and len(ds.buffer) == 2
+        await ds.disconnect()
+        assert calls == ["commit"]
+        assert (await Draft.lookup(id=1)).n == 99
+    asyncio.run(run())
+
+
+def test_update_of_buffered_delete_is_rejected(client):
+    async def run():
+        ds, calls, datastore = client(buffer_interval=60)
+        Draft.ds = ds
+        await Draft(id=1, n=1).save()
+        await ds.buffer.delete(Draft(id=1))
+        with pytest.raises(ValueError):
+            await ds.buffer.update(Draft(id=1, n=2))
+
+        # The entity can be saved anew
+        await ds.buffer.save(Draft(id=1, n=3))
+        await ds.buffer.flush()
+        assert (await Draft.lookup(id=1)).n == 3
+    asyncio.run(run())
+
+
+def test_failed_flush_is_buffered_again(client):
+    async def run():
+        ds, _, datastore = client(buffer_interval=0.05, retry={"commit": RetryPolicy(attempts=1)})
+        transport = ds.transport = FailingTransport(datastore)
+        Draft.ds = ds
+        transport.failures["commit"] = 1
+        await ds.buffer.save(Draft(id=1, n=1))
+        await ds.buffer.save(Draft(id=2, n=1))
+        await asyncio.sleep(0.07)
+        assert len(datastore) == 0 and len(ds.buffer) == 2
+
+        # Newer writes replace the failed ones
+        await ds.buffer.save(Draft(id=2, n=2))
+        await ds.buffer.save(Draft(id=3, n=3))
+        with pytest.raises(RequestFailed):
+            await ds.buffer.flush()
+        assert len(ds.buffer) == 0
+        assert sorted((draft.key.id, draft.n) for draft in await ds.lookup_multiple(*(Draft(id=i) for i in (1, 2, 3)))) == \
+            [(1, 1), (2, 2), (3, 3)]
+
+        # Mutations that would fail again are dropped
+        await ds.buffer.update(Draft(id=4, n=4))
+        with pytest.raises(RequestFailed):
+            await ds.buffer.flush()
+        assert len(ds.buffer) == 0
+    asyncio.run(run())
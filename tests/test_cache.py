@@ -0,0 +1,101 @@
+import asyncio
+
+from datastore.cache import EntityCache, QueryCache, MISSING
+from datastore.odm import Kind, IntegerField
+
+
+class Cached(Kind):
+    n = IntegerField(index=True)
+
+
+class Uncached(Kind):
+    n = IntegerField(index=True)
+
+
+async def collect(iterator) -> list:
+    return [value async for value in iterator]
+
+
+def test_lookups_are_served_from_cache(client):
+    async def run():
+        ds, calls, _ = client(cache=EntityCache())
+        Cached.ds = ds
+        await Cached(id=1, n=1).save()
+        calls.clear()
+
+        # Committed entities are cached, as well as the absence of the looked up ones
+        assert (await Cached.lookup(id=1)).n == 1
+        assert await Cached.lookup(id=2) is None
+        assert await Cached.lookup(id=2) is None
+        assert calls == ["lookup"]
+
+        entity = await Cached.lookup(id=1)
+        entity.n = 2
+        await entity.save()
+        await Cached(id=2, n=3).save()
+        await Cached(id=1).delete()
+        calls.clear()
+        assert await Cached.lookup(id=1) is None
+        assert (await Cached.lookup(id=2)).n == 3
+        assert calls == []
+
+        async with ds.Transaction(read_only=True) as transaction:
+            await transaction.lookup(Cached(id=2).key)
+        assert calls == ["beginTransaction", "lookup"]
+    asyncio.run(run())
+
+
+def test_entity_cache_bounds():
+    cache = EntityCache(max_entries=2, missing_ttl=0)
+    cache.put("a", {"entity": 1})
+    cache.put("b", {"entity": 2})
+    cache.get("a")
+    cache.put("c", {"entity": 3})
+    assert cache.get("b") is None and cache.get("a") == {"entity": 1} and len(cache) == 2
+
+    cache.put("a", MISSING)
+    assert cache.get("a") is None
+
+    cache = EntityCache(max_bytes=1)
+    cache.put("a", {"entity": 1})
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+def test_queries_are_invalidated_by_commits(client):
+    async def run():
+        ds, calls, _ = client(query_cache=QueryCache())
+        Cached.ds = Uncached.ds = ds
+        await Cached(id=1, n=1).save()
+        calls.clear()
+
+        assert len(await collect(Cached.find_where(n=1))) == 1
+        assert len(await collect(Cached.find_where(n=1))) == 1
+        assert calls == ["runQuery"]
+
+        # Commits of other kinds leave the results cached
+        await Uncached(id=1, n=1).save()
+        calls.clear()
+        assert len(await collect(Cached.find_where(n=1))) == 1
+        assert calls == []
+
+        await Cached(id=2, n=1).save()
+        calls.clear()
+        assert len(await collect(Cached.find_where(n=1))) == 2
+        assert calls == ["runQuery"]
+    asyncio.run(run())
+
+
+def test_eventual_queries_allow_staleness(client):
+    async def run():
+        ds, calls, _ = client(query_cache=QueryCache(max_staleness=60))
+        Cached.ds = ds
+        await Cached(id=1, n=1).save()
+        assert len(await collect(Cached.find_where(n=1, _eventual=True))) == 1
+
+        await Cached(id=2, n=1).save()
+        calls.clear()
+        assert len(await collect(Cached.find_where(n=1, _eventual=True))) == 1
+        assert calls == []
+        assert len(await collect(Cached.find_where(n=1))) == 2
+        assert calls == ["runQuery"]
+    asyncio.run(run())
@@ -0,0 +1,125 @@
+import asyncio
+
+from datastore import client as client_module
+from datastore.codec import default_codec
+from datastore.memory import MemoryDatastore, MemoryTransport
+from datastore.transport import HttpTransport
+from datastore.client import Client
+from datastore.odm import Kind, ArrayField, IntegerField, StringField
+
+
+class Note(Kind):
+    n = IntegerField()
+    text = StringField()
+    tags = ArrayField(StringField())
+
+
+class JsonTransport(MemoryTransport):
+    """
+    Serializes the bodies the way HttpTransport does, counting the encoded values
+    """
+
+    def __init__(self, datastore: MemoryDatastore) -> None:
+        super().__init__(datastore)
+        self.codec = default_codec()
+        self.encoded = 0
+        self.bodies = []
+
+    def prepare(self, data: dict):
+        self.encoded += 1
+        return HttpTransport.prepare(self, data)
+
+    def encode(self, value):
+        self.encoded += 1
+        return HttpTransport.encode(self, value)
+
+    prepare_parts = HttpTransport.prepare_parts
+
+    async def send(self, method: str, body: bytes):
+        self.bodies.append(body)
+        return self.datastore.call(method, self.codec.loads(body)), len(body)
+
+
+def test_batch_commits_the_last_mutation_of_a_key(client):
+    async def run():
+        ds, _, datastore = client()
+        Note.ds = ds
+        notes = [Note(id=i + 1, n=i) for i in range(600)]
+        async with ds.Batch() as batch:
+            for note in notes:
+                batch.save(note)
+            for note in notes:
+                batch.delete(note)
+            batch.save(notes[0])
+        assert len(datastore) == 1
+        assert (await Note.lookup(id=1)).n == 0
+    asyncio.run(run())
+
+
+def test_mutations_are_split_into_chunks(client):
+    async def run():
+        ds, calls, datastore = client()
+        Note.ds = ds
+        async with ds.Batch() as batch:
+            for i in range(1200):
+                batch.save(Note(id=i + 1, n=i))
+        assert calls == ["commit"] * 3
+        assert len(datastore) == 1200
+    asyncio.run(run())
+
+
+def test_mutations_are_encoded_once(monkeypatch):
+    async def run():
+        datastore = MemoryDatastore()
+        transport = JsonTransport(datastore)
+        ds = Client(project_id="test", transport=transport)
+        Note.ds = ds
+        monkeypatch.setattr(client_module, "COMMIT_MAX_BYTES", 2000)
+
+        notes = [Note(id=i + 1, n=i, text="x" * 100) for i in range(50)]
+        async with ds.Batch() as batch:
+            for note in notes:
+                batch.save(note)
+
+        # Every mutation and no whole body was encoded, the bodies are split by size
+        assert transport.encoded == 50
+        assert len(transport.bodies) > 1 and all(len(body) <= 2000 + 100 for body in transport.bodies)
+        assert len(datastore) == 50
+        assert (await Note.lookup(id=50)).text == "x" * 100
+    asyncio.run(run())
+
+
+def test_unchanged_entity_is_not_committed(client):
+    async def run():
+        ds, calls, _ = client()
+        Note.ds = ds
+        note = Note(id=1, n=1, tags=["a"])
+        assert await note.save()
+        calls.clear()
+        assert await note.save()
+        assert calls == []
+
+        note.n = 2
+        assert await note.save()
+        assert calls == ["commit"]
+
+        fetched = await Note.lookup(id=1)
+        assert not fetched._dirty
+        # Mutations of containers are tracked as well
+        fetched.tags.append("b")
+        assert fetched._dirty
+        await fetched.save()
+        assert list((await Note.lookup(id=1)).tags) == ["a", "b"]
+    asyncio.run(run())
+
+
+def test_deleted_entity_is_saved_again(client):
+    async def run():
+        ds, _, _ = client()
+        Note.ds = ds
+        note = Note(id=1, n=1)
+        await note.save()
+        await note.delete()
+        assert await note.save()
+        assert (await Note.lookup(id=1)).n == 1
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+from datastore.datatypes import Key
+
+
+def test_complete_keys_compare_by_value():
+    key = Key("p", "book", id=1)
+    assert key == Key("p", "book", id=1) and hash(key) == hash(Key("p", "book", id=1))
+    assert len({key, Key("p", "book", id=1), Key("p", "book", id=2)}) == 2
+
+    assert key != Key("p", "book", name="1")
+    assert key != Key("p", "book", namespace="n", id=1)
+    assert key != Key("p", "author", id=1)
+    assert key != Key("q", "book", id=1)
+    assert key != ("p", "book", 1)
+
+    # Keys received from Datastore carry the IDs as strings
+    wire = {"partitionId": {"projectId": "p", "namespaceId": None}, "path": [{"kind": "book", "id": "1"}]}
+    assert Key._from_entity(wire) == key
+    assert {key: "found"}[Key._from_entity(wire)] == "found"
+
+
+def test_partial_keys_are_equal_to_themselves_only():
+    key = Key("p", "book")
+    assert key == key and {key: 1}[key] == 1
+    assert key != Key("p", "book")
+    assert len({key, Key("p", "book")}) == 2
+
+    complete = Key("p", "book", id=1)
+    assert key != complete
+    key._complete(id=1)
+    assert key == complete and hash(key) == hash(complete)
+
+
+def test_keys_are_slotted():
+    assert not hasattr(Key("p", "book", id=1), "__dict__")
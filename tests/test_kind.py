@@ -0,0 +1,21 @@
+import pytest
+
+from datastore.odm import Kind, IntegerField
+
+
+class Book(Kind):
+    pages = IntegerField()
+
+
+class LockedBook(Book):
+    _kind = "book"
+
+
+def test_classes_of_a_kind_are_registered_once():
+    assert Kind._kinds["book"] is Book
+    assert Kind._kinds[LockedBook._kind] is Book
+
+    with pytest.raises(TypeError):
+        class Novel(Kind):
+            _kind = "book"
+    assert Kind._kinds["book"] is Book
@@ -0,0 +1,82 @@
+import asyncio
+
+from datastore import client as client_module
+from datastore.odm import Kind, IntegerField
+
+
+class Page(Kind):
+    n = IntegerField()
+
+
+def test_results_are_aligned_to_keys(client, monkeypatch):
+    async def run():
+        ds, calls, _ = client()
+        Page.ds = ds
+        async with ds.Batch() as batch:
+            for i in range(1, 11):
+                batch.save(Page(id=i, n=i))
+        monkeypatch.setattr(client_module, "LOOKUP_MAX_KEYS", 3)
+        calls.clear()
+
+        ids = [7, 11, 1, 7, 3, 12, 10, 2]
+        found = await ds.lookup_multiple(*(Page(id=i).key for i in ids))
+        assert [None if entity is None else entity.n for entity in found] == [7, None, 1, 7, 3, None, 10, 2]
+        # Duplicate keys are looked up once, but every position gets its own instance
+        assert found[0] is not found[3]
+        assert calls == ["lookup"] * 3
+    asyncio.run(run())
+
+
+def test_deferred_keys_are_looked_up_again(client):
+    async def run():
+        ds, calls, _ = client(datastore={"lookup_page": 4})
+        Page.ds = ds
+        async with ds.Batch() as batch:
+            for i in range(1, 11):
+                batch.save(Page(id=i, n=i))
+        calls.clear()
+
+        found = await ds.lookup_multiple(*(Page(id=i).key for i in range(10, 0, -1)))
+        assert [entity.n for entity in found] == list(range(10, 0, -1))
+        assert calls == ["lookup"] * 3
+    asyncio.run(run())
+
+
+class LockedPage(Page):
+    _kind = "page"
+
+
+def test_single_lookups_are_coalesced(client):
+    async def run():
+        ds, calls, _ = client(coalesce_lookups=True)
+        Page.ds = ds
+        async with ds.Batch() as batch:
+            for i in range(1, 11):
+                batch.save(Page(id=i, n=i))
+        calls.clear()
+
+        found = await asyncio.gather(*(Page.lookup(id=i) for i in range(1, 13)))
+        assert [None if entity is None else entity.n for entity in found] == [*range(1, 11), None, None]
+        assert calls == ["lookup"]
+
+        assert (await Page.lookup(id=1, eventual=True)).n == 1
+        assert calls == ["lookup"] * 2
+    asyncio.run(run())
+
+
+def test_entities_are_constructed_as_looked_up_class(client):
+    async def run():
+        for coalesce in (False, True):
+            ds, _, _ = client(coalesce_lookups=coalesce)
+            Page.ds = LockedPage.ds = ds
+            await Page(id=1, n=1).save()
+
+            found = await asyncio.gather(Page.lookup(id=1), LockedPage.lookup(id=1), Page(id=1).fetch(), LockedPage(id=1).fetch())
+            assert [type(entity) for entity in found] == [Page, LockedPage, Page, LockedPage]
+            assert [type(entity) for entity in await ds.lookup_multiple(Page(id=1).key, LockedPage(id=1))] == [Page, LockedPage]
+            assert type((await ds.lookup_multiple(Page(id=1).key, kind=LockedPage))[0]) is LockedPage
+
+            async with ds.Transaction(read_only=True) as transaction:
+                entity, = await transaction.lookup(LockedPage(id=1))
+            assert type(entity) is LockedPage
+    asyncio.run(run())
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from datastore.errors import RequestFailed, TransactionFailed
+from datastore.metrics import Metrics
+from datastore.odm import Kind, IntegerField
+
+
+class Gauge(Kind):
+    n = IntegerField()
+
+
+def total(metrics: Metrics, name: str) -> float:
+    return sum(metrics.counters.get(name, {}).values())
+
+
+def test_rpc_is_measured(client):
+    async def run():
+        measured = []
+        metrics = Metrics(callback=lambda name, value, labels: measured.append(name))
+        ds, _, _ = client(metrics=metrics)
+        Gauge.ds = ds
+        await Gauge(id=1, n=1).save()
+        await Gauge.lookup(id=1)
+        await Gauge.lookup(id=2)
+
+        assert metrics.counters["rpc_requests_total"] == {(("method", "commit"),): 1, (("method", "lookup"),): 2}
+        assert total(metrics, "lookup_missing_total") == 1
+        assert total(metrics, "rpc_mutations_total") == 1
+        assert sum(h.count for h in metrics.histograms["rpc_latency_seconds"].values()) == 3
+        assert "rpc_requests_total" in measured
+        assert 'datastore_rpc_requests_total{method="lookup"} 2' in metrics.prometheus()
+    asyncio.run(run())
+
+
+def test_only_transaction_aborts_are_conflicts(client):
+    async def run():
+        metrics = Metrics()
+        ds, _, _ = client(metrics=metrics)
+        Gauge.ds = ds
+        await Gauge(id=1, n=1).insert()
+
+        # An insert of an existing entity is an error, not a conflict
+        with pytest.raises(RequestFailed):
+            await Gauge(id=1, n=2).insert()
+        assert metrics.counters["rpc_errors_total"] == {(("method", "commit"), ("status", "409")): 1}
+        assert total(metrics, "transaction_conflicts_total") == 0
+
+        with pytest.raises(TransactionFailed):
+            async with ds.Transaction() as transaction:
+                gauge, = await transaction.lookup(Gauge(id=1))
+                await Gauge(id=1, n=3).save()
+                gauge.n = 4
+                transaction.save(gauge)
+        assert total(metrics, "rpc_errors_total") == 2
+        assert total(metrics, "transaction_conflicts_total") == 1
+    asyncio.run(run())
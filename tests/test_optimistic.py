@@ -0,0 +1,111 @@
+import asyncio
+
+from datastore.odm import Kind, IntegerField
+
+
+class Account(Kind):
+    _optimistic = True
+    n = IntegerField()
+
+
+class Memo(Kind):
+    n = IntegerField()
+
+
+def test_stale_optimistic_save_conflicts(client):
+    async def run():
+        ds, _, _ = client()
+        Account.ds = ds
+        await Account(id=1, n=1).save()
+        stale = await Account.lookup(id=1)
+        fresh = await Account.lookup(id=1)
+        fresh.n = 50
+        assert await fresh.save()
+
+        stale.n = 7
+        assert not await stale.save()
+        # The version of the conflict is not taken, so the entity keeps conflicting
+        assert not await stale.save()
+        assert (await Account.lookup(id=1)).n == 50
+    asyncio.run(run())
+
+
+def test_plain_save_is_not_conditioned(client):
+    async def run():
+        ds, _, _ = client()
+        Memo.ds = ds
+        await Memo(id=1, n=1).save()
+        first, second = await Memo.lookup(id=1), await Memo.lookup(id=1)
+        first.n, second.n = 2, 3
+        assert await first.save()
+        assert await second.save()
+        assert (await Memo.lookup(id=1)).n == 3
+    asyncio.run(run())
+
+
+def test_save_merged_refetches_conflicting_entities(client):
+    async def run():
+        ds, _, _ = client()
+        Memo.ds = ds
+        await Memo(id=1, n=0).save()
+
+        async def increment():
+            memo = await Memo.lookup(id=1)
+            await asyncio.sleep(0)
+            assert await memo.save_merged(lambda memo: setattr(memo, "n", memo.n + 1), retries=100)
+
+        await asyncio.gather(*(increment() for _ in range(20)))
+        assert (await Memo.lookup(id=1)).n == 20
+    asyncio.run(run())
+
+
+def test_save_merged_gives_up(client):
+    async def run():
+        ds, _, _ = client()
+        Memo.ds = ds
+        await Memo(id=1, n=0).save()
+        memo = await Memo.lookup(id=1)
+
+        async def merge(entity):
+            await Memo(id=1, n=99).save()
+            entity.n += 1
+
+        assert not await memo.save_merged(merge, retries=2)
+        assert (await Memo.lookup(id=1)).n == 99
+
+        deleted = await Memo.lookup(id=1)
+        await Memo(id=1).delete()
+        assert not await deleted.save_merged(lambda entity: setattr(entity, "n", 5))
+        assert await Memo.lookup(id=1) is None
+    asyncio.run(run())
+
+
+def test_transactions_are_not_conditioned_on_versions(client):
+    async def run():
+        ds, calls, _ = client()
+        Account.ds = ds
+        await Account(id=1, n=0).save()
+        stale = await Account.lookup(id=1)
+        await (await Account.lookup(id=1)).save_merged(lambda account: setattr(account, "n", 1))
+
+        # Transactions are isolated by Datastore, the version the entity was read at before does not matter
+        async with ds.Transaction() as transaction:
+            stale.n = 5
+            transaction.save(stale)
+        assert (await Account.lookup(id=1)).n == 5
+
+        attempts = 0
+
+        @ds.transaction(retry_max=5)
+        async def increment(transaction):
+            nonlocal attempts
+            attempts += 1
+            account, = await transaction.lookup(Account(id=1).key)
+            await asyncio.sleep(0)
+            account.n += 1
+            transaction.save(account)
+
+        await asyncio.gather(increment(), increment())
+        assert (await Account.lookup(id=1)).n == 7
+        assert attempts > 2
+    asyncio.run(run())
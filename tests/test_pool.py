@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from datastore.errors import IdPoolExhausted
+from datastore.odm import Kind, IntegerField
+
+
+class Ticket(Kind):
+    n = IntegerField()
+
+
+class Order(Kind):
+    n = IntegerField()
+
+
+def test_id_pool_is_filled_on_connect(client):
+    async def run():
+        ds, calls, _ = client(id_pool_size=10, id_pool_low_water=2, id_pool_kinds=["ticket"])
+        Ticket.ds = Order.ds = ds
+        with pytest.raises(IdPoolExhausted):
+            Order(prealocate=True)
+
+        await ds.connect()
+        calls.clear()
+        tickets = [Ticket(prealocate=True, n=i) for i in range(8)]
+        assert len({ticket.key.id for ticket in tickets}) == 8
+        assert calls == []
+
+        # The pool is refilled in the background once it is low
+        Ticket(prealocate=True)
+        await asyncio.sleep(0.01)
+        assert calls == ["allocateIds"]
+        assert ds.ids.available("ticket") == 11
+
+        key = await Order(n=1).preallocate()
+        assert key.id is not None
+        await ds.disconnect()
+    asyncio.run(run())
@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+
+from datastore.memory import MemoryTransport
+from datastore.odm import Kind, ArrayField, IntegerField, StringField
+
+
+class Item(Kind):
+    n = IntegerField(index=True)
+    colour = StringField(index=True)
+
+
+class Tagged(Kind):
+    n = IntegerField(index=True)
+    tags = ArrayField(StringField(), index=True)
+
+
+class SlowTransport(MemoryTransport):
+    """
+    Measures the max number of API Calls in flight
+    """
+
+    def __init__(self, datastore) -> None:
+        super().__init__(datastore)
+        self.running = 0
+        self.max_running = 0
+
+    async def send(self, method: str, body: dict):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.005)
+            return await super().send(method, body)
+        finally:
+            self.running -= 1
+
+
+async def collect(iterator) -> list:
+    return [value async for value in iterator]
+
+
+async def populate(ds) -> None:
+    Item.ds = ds
+    colours = ("red", "green", "blue")
+    async with ds.Batch() as batch:
+        for i in range(30):
+            batch.save(Item(id=i + 1, n=i % 10, colour=colours[i % 3]))
+
+
+def test_pages_are_prefetched(client):
+    async def run():
+        ds, calls, _ = client(datastore={"page_size": 4}, query_prefetch=2)
+        await populate(ds)
+        calls.clear()
+
+        pages = ds.query_pages(Item._request(None, Item._query(), False))
+        assert len(await pages.__anext__()) == 4
+        await asyncio.sleep(0.01)
+        # The consumer holds the first page, two more wait in the queue and the next one for a free slot
+        assert calls == ["runQuery"] * 4
+        assert sum(map(len, await collect(pages))) == 26
+    asyncio.run(run())
+
+
+def test_closed_query_stops_prefetching(client):
+    async def run():
+        ds, calls, _ = client(datastore={"page_size": 2})
+        await populate(ds)
+        calls.clear()
+
+        async for item in Item.find_where(_order=["n"]):
+            break
+        await asyncio.sleep(0.01)
+        assert calls.count("runQuery") <= 3
+        assert all(task.done() for task in asyncio.all_tasks() if task is not asyncio.current_task())
+    asyncio.run(run())
+
+
+def test_entities_are_constructed_as_queried_class(client):
+    async def run():
+        ds, _, _ = client()
+        await populate(ds)
+
+        class Colour(Item):
+            _kind = "item"
+
+        Colour.ds = ds
+        assert {type(item) for item in await collect(Item.find_where(colour="red"))} == {Item}
+        assert {type(item) for item in await collect(Colour.find_where(colour="red"))} == {Colour}
+    asyncio.run(run())
+
+
+def test_keys_and_properties_are_projected(client):
+    async def run():
+        ds, _, _ = client()
+        await populate(ds)
+
+        keys = await collect(Item.find_keys_where(colour="red", _quantity=3))
+        assert [key.id for key in keys] == [1, 4, 7]
+        rows = await collect(Item.project_where("n", "colour", colour="blue"))
+        assert sorted((row.key.id, row.n, row.colour) for row in rows)[:2] == [(3, 2, "blue"), (6, 5, "blue")]
+    asyncio.run(run())
+
+
+def test_array_fields_are_projected_by_element(client):
+    async def run():
+        ds, _, _ = client()
+        Tagged.ds = ds
+        await Tagged(id=1, n=1, tags=["a", "b"]).save()
+        await Tagged(id=2, n=2, tags=["c"]).save()
+        await Tagged(id=3, n=3, tags=[]).save()
+
+        rows = await collect(Tagged.project_where("n", "tags"))
+        assert sorted((row.key.id, row.n, row.tags) for row in rows) == [(1, 1, "a"), (1, 1, "b"), (2, 2, "c")]
+    asyncio.run(run())
+
+
+def test_in_filter_is_merged_in_order(client):
+    async def run():
+        ds, calls, _ = client(datastore={"page_size": 4})
+        await populate(ds)
+        calls.clear()
+
+        items = await collect(Item.find_where(colour__in=["red", "blue"], _order=["-n"]))
+        assert calls.count("runQuery") > 2
+        assert len(items) == 20
+        assert {item.colour for item in items} == {"red", "blue"}
+        ordered = [(-item.n, item.key.id) for item in items]
+        assert ordered == sorted(ordered)
+    asyncio.run(run())
+
+
+def test_overlapping_queries_are_deduplicated(client):
+    async def run():
+        ds, _, _ = client(datastore={"page_size": 3})
+        await populate(ds)
+
+        items = await collect(Item.find_where(_or=[{"colour": "red"}, {"n": 0}], _order=["n"]))
+        ids = [item.key.id for item in items]
+        assert len(ids) == len(set(ids))
+        assert set(ids) == {i + 1 for i in range(30) if i % 3 == 0 or i % 10 == 0}
+        assert [item.n for item in items] == sorted(item.n for item in items)
+
+        items = await collect(Item.find_where(colour__ne="green"))
+        assert len(items) == 20 and "green" not in {item.colour for item in items}
+    asyncio.run(run())
+
+
+def test_merged_queries_stop_at_limit(client):
+    async def run():
+        ds, _, _ = client(datastore={"page_size": 2})
+        await populate(ds)
+
+        items = await collect(Item.find_where(colour__in=["red", "green", "blue"], _order=["n"], _quantity=7))
+        assert [item.n for item in items] == [0, 0, 0, 1, 1, 1, 2]
+
+        requests = [Item._request(None, query, False) for query in Item._queries(None, ["n"], (), colour__in=["red", "blue"])[0]]
+        pages = await collect(ds.query_merged(requests, [("n", False)], limit=5))
+        assert sum(map(len, pages)) == 5
+    asyncio.run(run())
+
+
+def test_merged_queries_are_limited(client):
+    async def run():
+        ds, _, datastore = client(datastore={"page_size": 2}, query_concurrency=3)
+        await populate(ds)
+        transport = ds.transport = SlowTransport(datastore)
+
+        items = await collect(Item.find_where(n__in=range(10), colour__in=["red", "blue"]))
+        assert len(items) == 20
+        assert transport.max_running == 3
+
+        # Every combination of the values is a query
+        with pytest.raises(ValueError):
+            Item._queries(n__in=range(10), colour__in=["red", "green", "blue", "white"])
+        assert len(Item._queries(n__in=range(10), colour__in=["red", "green", "blue"])[0]) == 30
+    asyncio.run(run())
+
+
+def test_aggregations(client):
+    async def run():
+        ds, calls, _ = client()
+        await populate(ds)
+        calls.clear()
+
+        assert await Item.count_where(colour="red") == 10
+        assert await Item.count_where(colour="red", _up_to=4) == 4
+        assert await Item.sum_where("n") == 135
+        assert await Item.avg_where("n", colour="red") == 4.5
+        assert await Item.avg_where("n", colour="white") is None
+        assert calls == ["runAggregationQuery"] * 5
+
+        # Aggregations of the same entities are requested together
+        calls.clear()
+        assert await Item.aggregate_where("count", "sum__n", colour="blue") == {"count": 10, "sum__n": 45}
+        assert calls == ["runAggregationQuery"]
+    asyncio.run(run())
@@ -0,0 +1,169 @@
+from time import monotonic
+import asyncio
+
+import pytest
+
+from datastore.errors import RequestFailed, TransactionFailed
+from datastore.memory import MemoryTransport
+from datastore.odm import Kind, IntegerField
+from datastore.retry import RetryPolicy
+
+
+class Counter(Kind):
+    _optimistic = True
+    n = IntegerField()
+
+
+class Plain(Kind):
+    n = IntegerField()
+
+
+class FlakyTransport(MemoryTransport):
+    """
+    Fails the next API Calls of a method after they were applied, like a response lost on the way back
+    """
+
+    def __init__(self, datastore) -> None:
+        super().__init__(datastore)
+        self.failures = {}
+        self.calls = []
+
+    async def send(self, method: str, body: dict):
+        self.calls.append(method)
+        response = await super().send(method, body)
+        if self.failures.get(method):
+            self.failures[method] -= 1
+            raise RequestFailed(503, "Service unavailable")
+        return response
+
+
+def fast(**kwargs) -> RetryPolicy:
+    return RetryPolicy(**{"backoff": 0.001, "jitter": 0, **kwargs})
+
+
+def test_only_idempotent_commits_are_retried(client):
+    async def run():
+        ds, _, datastore = client(retry={"commit": fast()})
+        transport = ds.transport = FlakyTransport(datastore)
+        Counter.ds = Plain.ds = ds
+
+        async def commits(mutate) -> int:
+            transport.calls.clear()
+            transport.failures["commit"] = 1
+            try:
+                await mutate()
+            except RequestFailed:
+                pass
+            return transport.calls.count("commit")
+
+        # Applying these twice fails or creates a second entity
+        assert await commits(Plain(id=1, n=1).insert) == 1
+        assert await commits(Plain(n=1).save) == 1
+        await Counter(id=1, n=0).save()
+        counter = await Counter.lookup(id=1)
+        counter.n = 1
+        assert await commits(counter.save) == 1
+        assert len(datastore) == 3
+
+        # An upsert or a delete of a complete key has the same outcome when applied twice
+        assert await commits(Plain(id=2, n=2).save) == 2
+        assert await commits(Plain(id=2).delete) == 2
+
+        # A commit is retried only when all of its mutations are idempotent
+        async def mixed():
+            async with ds.Batch() as batch:
+                batch.save(Plain(id=3, n=3))
+                batch.save(Plain(n=4))
+        assert await commits(mixed) == 1
+    asyncio.run(run())
+
+
+def test_backoff_grows_up_to_max():
+    policy = RetryPolicy(backoff=0.1, max_backoff=0.5, multiplier=2, jitter=0)
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+
+    policy = RetryPolicy(backoff=0.1, jitter=1)
+    assert all(0 <= policy.delay(3) <= 0.4 for _ in range(100))
+
+
+def test_retries_stop_at_attempts_or_deadline():
+    async def run():
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            raise RequestFailed(503, "Service unavailable")
+
+        with pytest.raises(RequestFailed):
+            await fast(attempts=3).call(failing)
+        assert calls == 3
+
+        calls = 0
+        started = monotonic()
+        with pytest.raises(RequestFailed):
+            await fast(attempts=None, backoff=0.01, multiplier=1, deadline=0.1).call(failing)
+        assert 3 < calls <= 10 and monotonic() - started < 0.2
+
+        calls = 0
+
+        async def invalid():
+            nonlocal calls
+            calls += 1
+            raise RequestFailed(400, "Bad request")
+
+        with pytest.raises(RequestFailed):
+            await fast().call(invalid)
+        assert calls == 1
+
+        # A slow attempt is cut off by the deadline
+        with pytest.raises(asyncio.TimeoutError):
+            await fast(deadline=0.05).call(lambda: asyncio.sleep(10))
+    asyncio.run(run())
+
+
+def test_transaction_retries_until_deadline(client):
+    async def run():
+        ds, _, _ = client()
+        attempts = 0
+
+        async def conflicting(transaction):
+            nonlocal attempts
+            attempts += 1
+            raise TransactionFailed(transaction.id, "Conflict")
+
+        started = monotonic()
+        with pytest.raises(TransactionFailed):
+            await ds.transaction(retry_max=None, retry=fast(attempts=None, backoff=0.01, multiplier=1, deadline=0.1))(conflicting)()
+        assert attempts > 3 and monotonic() - started < 0.5
+
+        attempts = 0
+        with pytest.raises(TransactionFailed):
+            await ds.transaction(retry_max=2, retry=fast(attempts=None))(conflicting)()
+        assert attempts == 3
+
+        attempts = 0
+        with pytest.raises(TransactionFailed):
+            await ds.transaction(retry_max=None, retry=fast(attempts=4))(conflicting)()
+        assert attempts == 4
+    asyncio.run(run())
+
+
+def test_slow_requests_are_hedged():
+    async def run():
+        policy = RetryPolicy(hedge_percentile=90, hedge_min_samples=5)
+        for _ in range(5):
+            assert await policy.call(lambda: asyncio.sleep(0.001, "fast")) == "fast"
+
+        calls = 0
+
+        async def request():
+            nonlocal calls
+            calls += 1
+            # The first request is stuck, the hedging one is not
+            return await asyncio.sleep(10 if calls == 1 else 0.001, calls)
+
+        started = monotonic()
+        assert await policy.call(request) == 2
+        assert calls == 2 and monotonic() - started < 1
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+import asyncio
+
+from datastore.odm import Kind, Embedded, ArrayField, BooleanField, DoubleField, IntegerField, StringField
+
+
+class Author(Embedded):
+    id = IntegerField()
+    name = StringField()
+    alive = BooleanField()
+
+
+class Record(Kind):
+    title = StringField(index=True)
+    released = BooleanField()
+    rating = DoubleField()
+    n_borrowed = IntegerField()
+    author = Author()
+    tags = ArrayField(StringField())
+    co_authors = ArrayField(Author())
+
+
+Record.ds = SimpleNamespace(project_id="test")
+
+
+def record() -> Record:
+    return Record(id=1, title="No Longer Human", released=True, rating=4.5, n_borrowed=3,
+                  author=Author(id=1, name="Osamu Dazai", alive=False), tags=["novel", "ja"],
+                  co_authors=[Author(id=2, name="A"), Author(id=3, alive=True)])
+
+
+def generic(monkeypatch) -> None:
+    for cls in (Record, Author):
+        monkeypatch.setattr(cls, "_encode", None)
+        monkeypatch.setattr(cls, "_decode", None)
+        monkeypatch.setattr(cls, "_decode_trusted", None, raising=False)
+
+
+def plain(value):
+    # Embedded values are equal to each other by their fields, not by their values
+    if isinstance(value, Embedded):
+        return {name: plain(getattr(value, name)) for name in value._fields}
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    return value
+
+
+def values(entity: Record) -> dict:
+    return {name: plain(getattr(entity, name)) for name in Record._fields}
+
+
+def test_compiled_serializers_match_generic_path(monkeypatch):
+    entities = (record(), Record(id=2, author=Author(name="B")),
+                Record(id=3, author=Author(alive=True), tags=["a"], co_authors=[Author(id=4)]))
+    for entity in entities:
+        compiled = entity._to_entity()
+        decoded = Record._from_entity({"entity": compiled, "version": "1"})
+        decoded_trusted, = Record._from_entities([{"entity": compiled, "version": "1"}])
+
+        with monkeypatch.context() as patch:
+            generic(patch)
+            assert entity._to_entity() == compiled
+            decoded_generic = Record._from_entity({"entity": compiled, "version": "1"})
+
+        assert values(decoded) == values(decoded_trusted) == values(decoded_generic) == values(entity)
+        assert decoded_generic._to_entity() == compiled
+
+
+class Lazy(Kind):
+    _lazy = True
+    n = IntegerField()
+    text = StringField()
+    tags = ArrayField(StringField())
+    author = Author()
+
+
+def test_untouched_raw_values_are_passed_through(client):
+    async def run():
+        ds, _, datastore = client()
+        Lazy.ds = ds
+        await Lazy(id=1, n=1, text="x", tags=["a", "b"], author=Author(id=1, name="A")).save()
+        stored = datastore.call("lookup", {"keys": [Lazy(id=1).key._entity]})["found"][0]["entity"]["properties"]
+
+        entity = await Lazy.lookup(id=1)
+        assert entity._data == {} and set(entity._raw) == {"n", "text", "tags", "author"}
+        entity.n += 1
+        assert set(entity._raw) == {"text", "tags", "author"}
+
+        properties = entity._to_entity()["properties"]
+        # Values never accessed are the ones received, not decoded and encoded again
+        assert all(properties[name] is entity._raw[name] for name in ("text", "tags", "author"))
+        assert await entity.save()
+
+        resaved = datastore.call("lookup", {"keys": [Lazy(id=1).key._entity]})["found"][0]["entity"]["properties"]
+        assert resaved == dict(stored, n={"integerValue": "2"})
+        entity = await Lazy.lookup(id=1)
+        assert (entity.n, entity.text, list(entity.tags), entity.author.name) == (2, "x", ["a", "b"], "A")
+    asyncio.run(run())
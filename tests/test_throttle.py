@@ -0,0 +1,73 @@
+from time import monotonic
+import asyncio
+
+import pytest
+
+from datastore.odm import Kind, IntegerField
+from datastore.throttle import WriteThrottle
+
+
+class Metered(Kind):
+    n = IntegerField()
+
+
+def test_rate_grows_every_period():
+    async def run():
+        throttle = WriteThrottle(start=100, growth=0.5, period=0.1, max_rate=200)
+        assert throttle.rate("metered") == 100
+        await throttle.acquire({"metered": 1})
+        assert throttle.rate("metered") == 100
+        await asyncio.sleep(0.12)
+        assert throttle.rate("metered") == 150
+        await asyncio.sleep(0.1)
+        # 225 is capped by max_rate
+        assert throttle.rate("metered") == 200
+        # Other kinds ramp up on their own
+        assert throttle.rate("other") == 100
+    asyncio.run(run())
+
+
+def test_ramp_up_resets_after_idle():
+    async def run():
+        throttle = WriteThrottle(start=100, period=0.05, reset_after=0.15)
+        await throttle.acquire({"metered": 1})
+        await asyncio.sleep(0.2)
+        assert throttle.rate("metered") > 100
+        await throttle.acquire({"metered": 1})
+        assert throttle.rate("metered") == 100
+    asyncio.run(run())
+
+
+def test_writes_over_the_rate_wait_in_order():
+    async def run():
+        throttle = WriteThrottle(start=100)
+        done = []
+
+        async def write(i: int) -> None:
+            await throttle.acquire({"metered": 10})
+            done.append((i, monotonic() - started))
+
+        started = monotonic()
+        # The first second worth of operations passes right away
+        await throttle.acquire({"metered": 100})
+        assert monotonic() - started < 0.05
+        await asyncio.gather(*(write(i) for i in range(3)))
+
+        # None of the writes is dropped, each waits for its own 10 operations to be paid off
+        assert [i for i, _ in done] == [0, 1, 2]
+        for i, elapsed in done:
+            assert elapsed == pytest.approx(0.1 * (i + 1), abs=0.05)
+    asyncio.run(run())
+
+
+def test_commits_wait_for_the_throttle(client):
+    async def run():
+        ds, calls, datastore = client(throttle=WriteThrottle(start=100))
+        Metered.ds = ds
+        started = monotonic()
+        async with ds.Batch() as batch:
+            for i in range(150):
+                batch.save(Metered(n=i))
+        assert monotonic() - started == pytest.approx(0.5, abs=0.1)
+        assert len(datastore) == 150
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from datastore.errors import TransactionFailed
+from datastore.odm import Kind, IntegerField
+
+
+class Ledger(Kind):
+    n = IntegerField()
+
+
+def test_transaction_lifecycle(client):
+    async def run():
+        ds, calls, _ = client()
+        Ledger.ds = ds
+        await Ledger(id=1, n=1).save()
+        key = Ledger(id=1).key
+
+        calls.clear()
+        async with ds.Transaction(read_only=True) as transaction:
+            first, = await transaction.lookup(key)
+            again, = await transaction.lookup(key)
+            _, missing = await transaction.lookup(key, Ledger(id=2).key)
+        assert first is again and missing is None
+        # Read-only transactions end without a commit, entities already read are not fetched again
+        assert calls == ["beginTransaction", "lookup", "lookup"]
+
+        calls.clear()
+        async with ds.Transaction() as transaction:
+            ledger, = await transaction.lookup(key)
+            ledger.n = 2
+            transaction.save(ledger)
+        assert calls == ["beginTransaction", "lookup", "commit"]
+        assert (await Ledger.lookup(id=1)).n == 2
+
+        # A read-write transaction without mutations is committed as well, which releases its locks
+        calls.clear()
+        async with ds.Transaction() as transaction:
+            await transaction.lookup(key)
+        assert calls == ["beginTransaction", "lookup", "commit"]
+
+        calls.clear()
+        with pytest.raises(KeyError):
+            async with ds.Transaction() as transaction:
+                await transaction.lookup(key)
+                raise KeyError
+        assert calls == ["beginTransaction", "lookup", "rollback"]
+    asyncio.run(run())
+
+
+def test_read_only_transaction_can_not_mutate(client):
+    async def run():
+        ds, calls, _ = client()
+        Ledger.ds = ds
+        await Ledger(id=1, n=1).save()
+
+        calls.clear()
+        with pytest.raises(ValueError):
+            async with ds.Transaction(read_only=True) as transaction:
+                ledger, = await transaction.lookup(Ledger(id=1))
+                ledger.n = 2
+                transaction.save(ledger)
+        assert calls == ["beginTransaction", "lookup"]
+        assert (await Ledger.lookup(id=1)).n == 1
+    asyncio.run(run())
+
+
+def test_aborted_transaction_raises(client):
+    async def run():
+        ds, _, _ = client()
+        Ledger.ds = ds
+        await Ledger(id=1, n=0).save()
+        with pytest.raises(TransactionFailed):
+            async with ds.Transaction() as transaction:
+                ledger, = await transaction.lookup(Ledger(id=1).key)
+                other = await Ledger.lookup(id=1)
+                other.n = 2
+                await other.save()
+                ledger.n = 1
+                transaction.save(ledger)
+        assert (await Ledger.lookup(id=1)).n == 2
+    asyncio.run(run())
@@ -0,0 +1,150 @@
+from collections import Counter
+from contextlib import asynccontextmanager
+from time import time
+import asyncio
+import json
+import os
+
+import pytest
+
+from aiohttp import web
+
+from datastore.auth import TokenCache
+from datastore.benchmarks.server import FakeDatastore
+from datastore.client import Client
+from datastore.codec import Codec
+from datastore.errors import RequestFailed
+from datastore.odm import Kind, IntegerField
+
+
+class Entry(Kind):
+    n = IntegerField()
+
+
+@asynccontextmanager
+async def served(tmp_path, **kwargs):
+    """
+    :return: FakeDatastore and a connected client sending the API Calls to it over HTTP
+    """
+    server = FakeDatastore()
+    endpoint = await server.start()
+    try:
+        ds = Client(server.credentials(str(tmp_path / "credentials.json")), endpoint=endpoint, **kwargs)
+        await ds.connect()
+        try:
+            yield server, ds
+        finally:
+            await ds.disconnect()
+    finally:
+        await server.stop()
+
+
+def test_codec_encodes_to_bytes():
+    codec = Codec(json.dumps, json.loads)
+    assert codec.dumps({"a": "é"}) == json.dumps({"a": "é"}).encode()
+    assert codec.loads(codec.dumps([1])) == [1]
+
+
+def test_bodies_are_encoded_and_decoded_once(tmp_path):
+    counts = Counter()
+
+    def dumps(value):
+        counts["dumps"] += 1
+        return json.dumps(value)
+
+    def loads(value):
+        counts["loads"] += 1
+        return json.loads(value)
+
+    async def run():
+        async with served(tmp_path, codec=Codec(dumps, loads)) as (server, ds):
+            Entry.ds = ds
+            counts.clear()
+            await Entry(id=1, n=1).save()
+            await Entry(id=2, n=2).save()
+            # The mutation and the rest of the body
+            assert counts == {"dumps": 4, "loads": 2}
+
+            counts.clear()
+            found = await ds.lookup_multiple(Entry(id=1), Entry(id=2), Entry(id=3))
+            assert [entity and entity.n for entity in found] == [1, 2, None]
+            assert counts == {"dumps": 1, "loads": 1}
+
+            with pytest.raises(RequestFailed) as error:
+                await Entry(id=1, n=3).insert()
+            assert error.value.status == 409
+            assert server.calls["commit"] == 3
+    asyncio.run(run())
+
+
+def test_token_cache_shares_tokens(tmp_path):
+    async def run():
+        requests = []
+
+        async def request():
+            requests.append(time())
+            await asyncio.sleep(0.01)
+            return f"token-{len(requests)}", time() + 3600
+
+        cache = TokenCache(str(tmp_path / "tokens"))
+        # Concurrent renewals wait for the lock and reuse the token
+        tokens = await asyncio.gather(*(cache.get("account", request, 100) for _ in range(5)))
+        assert tokens == [tokens[0]] * 5 and tokens[0][0] == "token-1"
+        assert len(requests) == 1
+        assert os.stat(tmp_path / "tokens").st_mode & 0o777 == 0o600
+
+        assert (await TokenCache(str(tmp_path / "tokens")).get("account", request, 100))[0] == "token-1"
+        assert (await cache.get("other", request, 100))[0] == "token-2"
+        # A token valid for less than the min validity is renewed
+        assert (await cache.get("account", request, 7200))[0] == "token-3"
+    asyncio.run(run())
+
+
+def test_clients_share_tokens_through_cache(tmp_path):
+    async def run():
+        server = FakeDatastore()
+        tokens = 0
+
+        async def token(_):
+            nonlocal tokens
+            tokens += 1
+            return web.json_response({"access_token": "shared", "expires_in": 3600})
+
+        server._FakeDatastore__token = token
+        endpoint = await server.start()
+        try:
+            credentials = server.credentials(str(tmp_path / "credentials.json"))
+            clients = [Client(credentials, endpoint=endpoint, token_cache=TokenCache(str(tmp_path / "tokens")))
+                       for _ in range(3)]
+            await asyncio.gather(*(ds.connect() for ds in clients))
+            assert tokens == 1
+            await asyncio.gather(*(ds.disconnect() for ds in clients))
+        finally:
+            await server.stop()
+    asyncio.run(run())
+
+
+def test_connect_fails(tmp_path):
+    async def run():
+        server = FakeDatastore()
+        delay = 0
+
+        async def token(_):
+            await asyncio.sleep(delay)
+            return web.json_response({"error": "invalid_grant"}, status=400)
+
+        server._FakeDatastore__token = token
+        endpoint = await server.start()
+        try:
+            ds = Client(server.credentials(str(tmp_path / "credentials.json")), endpoint=endpoint)
+            with pytest.raises(RequestFailed) as error:
+                await ds.connect()
+            assert error.value.status == 400 and not ds.connected
+
+            delay = 1
+            with pytest.raises(ConnectionError):
+                await ds.connect(timeout=0.05)
+            assert not ds.connected
+        finally:
+            await server.stop()
+    asyncio.run(run())
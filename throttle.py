@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from time import monotonic
+from typing import Dict, Mapping, Optional
+import asyncio
+
+
+class _Bucket:
+    __slots__ = ("started", "updated", "tokens", "lock")
+
+    def __init__(self, now: float) -> None:
+        self.started = now
+        self.updated = now
+        self.tokens = 0.
+        self.lock = asyncio.Lock()
+
+
+class WriteThrottle:
+    """
+    Rate limit of the writes per kind following the "500/50/5" rule:
+    starts at 500 operations per second and grows by 50% every 5 minutes.
+    https://cloud.google.com/datastore/docs/best-practices#ramping_up_traffic
+    Writes over the limit wait in the order they came in. One instance can be shared by several clients
+    """
+
+    def __init__(self, start: float = 500, growth: float = 0.5, period: float = 300, max_rate: Optional[float] = None,
+                 reset_after: Optional[float] = 300) -> None:
+        """
+        :param start: operations per second a kind starts with
+        :param growth: fraction the rate grows by every period
+        :param period: seconds between the growths
+        :param max_rate: operations per second the growth stops at. Not limited by default
+        :param reset_after: seconds without writes to a kind, after which its ramp-up starts over. None to never reset
+        """
+        self.start = start
+        self.growth = growth
+        self.period = period
+        self.max_rate = max_rate
+        self.reset_after = reset_after
+        self.__buckets: Dict[str, _Bucket] = {}
+
+    def rate(self, kind: str) -> float:
+        """
+        :return: current operations per second of the kind
+        """
+        bucket = self.__buckets.get(kind)
+        return self.start if bucket is None else self.__rate(bucket, monotonic())
+
+    def __rate(self, bucket: _Bucket, now: float) -> float:
+        rate = self.start * (1 + self.growth) ** int((now - bucket.started) / self.period)
+        return rate if self.max_rate is None else min(rate, self.max_rate)
+
+    async def acquire(self, operations: Mapping[str, int]) -> None:
+        """
+        Waits until the operations fit in the rates of their kinds
+        :param operations: number of operations by kind
+        """
+        for kind, n in operations.items():
+            await self.__acquire(kind, n)
+
+    async def __acquire(self, kind: str, n: int) -> None:
+        now = monotonic()
+        bucket = self.__buckets.get(kind)
+        if bucket is None or (self.reset_after is not None and not bucket.lock.locked() and
+                              now - bucket.updated > self.reset_after):
+            bucket = self.__buckets[kind] = _Bucket(now)
+            bucket.tokens = self.start
+
+        async with bucket.lock:
+            now = monotonic()
+            rate = self.__rate(bucket, now)
+            # At most a second worth of operations is accumulated
+            bucket.tokens = min(bucket.tokens + (now - bucket.updated) * rate, rate) - n
+            bucket.updated = now
+            if bucket.tokens < 0:
+                # Operations over the limit are taken on credit, and the following ones wait until it is paid off
+                await asyncio.sleep(-bucket.tokens / rate)
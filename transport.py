@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from abc import ABCMeta, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from time import time
+from os import getenv
+import asyncio
+import functools
+import json
+
+from aiohttp import ClientSession, TCPConnector
+import jwt
+
+from .auth import TokenCache
+from .codec import Codec, default_codec
+from .errors import RequestFailed
+
+ENDPOINT = "https://datastore.googleapis.com"
+REQUEST_URL = "{endpoint}/v1/projects/{project_id}:{method}"
+
+TOKEN_LIFETIME_S = 3600
+TOKEN_RENEW_BEFOREHAND_S = 100
+TOKEN_RETRY_BACKOFF_S = 1
+TOKEN_RETRY_MAX_BACKOFF_S = 30
+CONNECT_TIMEOUT_S = 30
+
+
+class Transport(metaclass=ABCMeta):
+    """
+    Carries the API Calls of a client. Requests and responses are the bodies of the REST API
+    https://cloud.google.com/datastore/docs/reference/data/rest
+    """
+    # Project of the credentials, if the transport has any
+    project_id: Optional[str] = None
+
+    async def connect(self, timeout: Optional[float] = None) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    def prepare(self, data: dict) -> Tuple[Any, int]:
+        """
+        Prepares a request body once for all the attempts to send it
+        :return: prepared body and its size in bytes
+        """
+        return data, 0
+
+    def encode(self, value: Any) -> Optional[bytes]:
+        """
+        Encodes a part of a request body, see Transport.prepare_parts
+        :return: None if the transport does not serialize the bodies
+        """
+        return None
+
+    def prepare_parts(self, data: dict, name: str, parts: List[bytes]) -> Tuple[Any, int]:
+        """
+        Prepares a request body whose list "name" is made of parts already encoded with Transport.encode,
+        so that they are not encoded again
+        :param data: rest of the body, without "name"
+        :return: prepared body and its size in bytes
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def send(self, method: str, body: Any) -> Tuple[dict, int]:
+        """
+        :param method: of the API Call, e.g. "commit"
+        :param body: prepared with Transport.prepare
+        :raise RequestFailed: if the API Call did not succeed
+        :return: response body and its size in bytes
+        """
+
+
+class HttpTransport(Transport):
+    """
+    Sends the API Calls to the REST API, authorized with an access token of a service account
+    """
+    __update_token_loop: asyncio.Task = NotImplemented
+    _session: ClientSession = NotImplemented
+
+    def __init__(self, credentials: Optional[str] = None, codec: Optional[Codec] = None, endpoint: str = ENDPOINT,
+                 token_cache: Optional[TokenCache] = None) -> None:
+        """
+        :param credentials: path to the service account credentials
+        If not present will be attempted to receive with env GOOGLE_APPLICATION_CREDENTIALS
+        :param codec: JSON codec of the bodies. By default, the fastest installed one
+        :param endpoint: root URL of the Datastore API, e.g. of an emulator
+        :param token_cache: access token cache shared with the other processes of the host
+        """
+        with open(getenv("GOOGLE_APPLICATION_CREDENTIALS") if credentials is None else credentials) as file:
+            credentials = json.load(file)
+            self.project_id = credentials.pop("project_id")
+            self.__token_uri = credentials.get("token_uri")
+            self.__private_key = credentials.get("private_key")
+            self.__client_email = credentials.get("client_email")
+
+        self.codec = default_codec() if codec is None else codec
+        self.token_cache = token_cache
+        self.__url = REQUEST_URL.format(endpoint=endpoint.rstrip("/"), project_id=self.project_id, method="{method}")
+        self.__urls: Dict[str, str] = {}
+
+    async def __request_token(self, session: ClientSession) -> Tuple[str, float]:
+        """
+        :raise RequestFailed: if the access token was not granted
+        :return: access token and its expiry timestamp
+        """
+        now = int(time())
+        payload = {"aud": self.__token_uri,
+                   "iss": self.__client_email,
+                   "scope": "https://www.googleapis.com/auth/datastore",
+                   "iat": now,
+                   "exp": now + TOKEN_LIFETIME_S}
+        data = {"grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": jwt.encode(payload, self.__private_key, algorithm="RS256")}
+
+        async with session.post(self.__token_uri, data=urlencode(data)) as response:
+            if response.status != 200:
+                raise RequestFailed(response.status, f"Access token request failed: {await response.text()}")
+            response = await response.json()
+        return response["access_token"], now + response["expires_in"]
+
+    async def connect(self, timeout: Optional[float] = CONNECT_TIMEOUT_S) -> None:
+        """
+        Receives an access token and keeps renewing it in the background.
+        Once connected, failed renewals are retried while the current token is still valid
+        :param timeout: seconds to wait for the first access token
+        :raise RequestFailed: if the access token was not granted
+        :raise ConnectionError: if the access token was not received in time
+        """
+        async def update_token_loop(ready: asyncio.Future) -> None:
+            async with ClientSession(headers={"content-type": "application/x-www-form-urlencoded"}) as session:
+                request = functools.partial(self.__request_token, session)
+                backoff = TOKEN_RETRY_BACKOFF_S
+                while True:
+                    try:
+                        if self.token_cache is None:
+                            token, expires_at = await request()
+                        else:
+                            token, expires_at = await self.token_cache.get(self.__client_email, request, TOKEN_RENEW_BEFOREHAND_S)
+                    except Exception as error:
+                        if not ready.done():
+                            ready.set_exception(error)
+                            return
+                        await asyncio.sleep(backoff)
+                        backoff = min(backoff * 2, TOKEN_RETRY_MAX_BACKOFF_S)
+                        continue
+
+                    backoff = TOKEN_RETRY_BACKOFF_S
+                    self._session._default_headers.update(Authorization="Bearer " + token)
+                    if not ready.done():
+                        ready.set_result(None)
+
+                    # Tokens shorter-lived than TOKEN_RENEW_BEFOREHAND_S are renewed at the half of their lifetime
+                    lifetime = expires_at - time()
+                    await asyncio.sleep(max(lifetime - TOKEN_RENEW_BEFOREHAND_S, lifetime / 2))
+
+        ready = asyncio.get_running_loop().create_future()
+        self._session = ClientSession(connector=TCPConnector(limit=0), headers={"Content-Type": "application/json"})
+        self.__update_token_loop = asyncio.create_task(update_token_loop(ready))
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except BaseException as error:
+            await self.disconnect()
+            if isinstance(error, asyncio.TimeoutError):
+                raise ConnectionError(f"Access token was not received in {timeout} seconds") from error
+            raise
+
+    async def disconnect(self) -> None:
+        self.__update_token_loop.cancel()
+        await self._session.close()
+        self.__update_token_loop = self._session = NotImplemented
+
+    def prepare(self, data: dict) -> Tuple[bytes, int]:
+        body = self.codec.dumps(data)
+        return body, len(body)
+
+    def encode(self, value: Any) -> bytes:
+        return self.codec.dumps(value)
+
+    def prepare_parts(self, data: dict, name: str, parts: List[bytes]) -> Tuple[bytes, int]:
+        # The empty list is encoded last, right before the closing brace
+        head = self.codec.dumps(dict(data, **{name: []}))
+        body = b"".join((head[:-2], b",".join(parts), head[-2:]))
+        return body, len(body)
+
+    async def send(self, method: str, body: bytes) -> Tuple[dict, int]:
+        url = self.__urls.get(method)
+        if url is None:
+            url = self.__urls[method] = self.__url.format(method=method)
+        async with self._session.post(url, data=body) as response:
+            content = await response.read()
+            if response.status != 200:
+                raise RequestFailed(response.status, f"Datastore API Call failed: {content.decode(errors='replace')}")
+        return self.codec.loads(content), len(content)